@@ -1,7 +1,15 @@
+import collections
+import concurrent.futures
 import functools
 import itertools
+import multiprocessing
+import os
+import threading
+import time
 from enum import Enum
-from typing import List, Tuple, Set
+from typing import Dict, Iterable, List, Sequence, Tuple, Set
+
+from app import instrumentation
 
 
 class CutType(Enum):
@@ -15,16 +23,26 @@ class CutType(Enum):
 
 
 class Activity:
-    def __init__(self, label: str, event_type: str = "d", name=None):
-        self.label = label  # acts as ID
-        self.event_type = event_type  # s: start or c: complete / d: default for collapsed
-        self.name = name if name else label
-
-    def __eq__(self, other):
-        return self.label == other.label and self.event_type == other.event_type
-
-    def __hash__(self):
-        return hash((self.label, self.event_type))  # Hash based on label and event_type
+    """
+    Interned: there is one Activity per label, event type and name (activity IDs repeat across process models with
+    other names), so equality and hashing are by identity and get_default/get_start/get_complete do not allocate.
+    """
+    __slots__ = ("label", "event_type", "name")
+    interned: Dict[Tuple[str, str, str], "Activity"] = {}
+
+    def __new__(cls, label: str, event_type: str = "d", name=None):
+        name = name if name else label
+        activity = cls.interned.get((label, event_type, name))
+        if activity is None:
+            activity = super().__new__(cls)
+            activity.label = label  # acts as ID
+            activity.event_type = event_type  # s: start or c: complete / d: default for collapsed
+            activity.name = name
+            activity = cls.interned.setdefault((label, event_type, name), activity)
+        return activity
+
+    def __reduce__(self):
+        return Activity, (self.label, self.event_type, self.name)
 
     def __repr__(self):
         return f"{self.label}_{self.event_type}" if self.event_type != "d" else self.label
@@ -45,6 +63,112 @@ class Activity:
         return Activity(self.label, "c", self.name)
 
 
+# The miner works on integer encoded activities: code = activity ID << 2 | lifecycle bits
+DEFAULT, START, COMPLETE = 0, 1, 2
+EVENT_TYPES = {"d": DEFAULT, "s": START, "c": COMPLETE}
+TAU = 0  # τ always has the activity ID 0
+
+
+def get_default(code: int) -> int:
+    return code & ~3
+
+
+def get_start(code: int) -> int:
+    return code & ~3 | START
+
+
+def get_complete(code: int) -> int:
+    return code & ~3 | COMPLETE
+
+
+class Alphabet:
+    """Interns activity labels as integer IDs; Activity objects are only rebuilt for labels of the results."""
+
+    def __init__(self):
+        self.labels = ["τ"]
+        self.names = ["τ"]
+        self.ids = {"τ": TAU}
+
+    def encode(self, activity: Activity) -> int:
+        activity_id = self.ids.get(activity.label)
+        if activity_id is None:
+            activity_id = self.ids[activity.label] = len(self.labels)
+            self.labels.append(activity.label)
+            self.names.append(activity.name)
+        return activity_id << 2 | EVENT_TYPES[activity.event_type]
+
+    def decode(self, code: int) -> Activity:
+        return Activity(self.labels[code >> 2], "dsc"[code & 3], self.names[code >> 2])
+
+    def encode_traces(self, traces) -> "Variants":
+        variants = {}
+        for trace, count in get_variants(traces).items():
+            add_variant(variants, [self.encode(a) for a in trace], count)
+        return variants
+
+    def decode_variants(self, variants: "Variants"):
+        return {tuple(self.decode(e) for e in trace): count for trace, count in variants.items()}
+
+    def decode_partitions(self, partitions):
+        return [{self.decode(a) for a in p} for p in partitions]
+
+
+Trace = Tuple[int, ...]
+Variants = Dict[Trace, int]  # trace variant -> number of traces, in order of first occurrence
+
+
+def add_variant(variants: Variants, trace: Sequence[int], count: int = 1):
+    trace = tuple(trace)
+    variants[trace] = variants.get(trace, 0) + count
+
+
+def get_variants(traces) -> Variants:
+    if isinstance(traces, dict):
+        return traces
+    variants = {}
+    for trace in traces:
+        add_variant(variants, trace)
+    return variants
+
+
+class DisjointSet:
+    """
+    Union-find with path compression over singletons (elements) and initial groups. partitions() returns the sets in
+    the order the list-of-sets merging it replaces produced them: untouched sets in their initial order, then the
+    merged ones in the order of their last merge, each the union of the set of a with the set of b. The cut checks
+    (concurrent_start_end_activities) depend on that order, so it must not change with the data structure.
+    """
+
+    def __init__(self, elements=(), groups=()):
+        self.parent, self.members, self.position = {}, {}, {}
+        self.merges = itertools.count()
+        for group in itertools.chain(([e] for e in elements), groups):
+            root = group[0]
+            for e in group:
+                self.parent[e] = root
+            self.members[root] = set(group)
+            self.position[root] = next(self.merges)
+
+    def find(self, a):
+        root = a
+        while self.parent[root] != root:
+            root = self.parent[root]
+        while self.parent[a] != root:
+            self.parent[a], a = root, self.parent[a]
+        return root
+
+    def union(self, a, b):
+        root_a, root_b = self.find(a), self.find(b)
+        if root_a != root_b:
+            self.parent[root_b] = root_a
+            self.members[root_a] = self.members[root_a] | self.members.pop(root_b)
+            del self.position[root_b]
+            self.position[root_a] = next(self.merges)
+
+    def partitions(self) -> List[Set]:
+        return [self.members[root] for root in sorted(self.position, key=self.position.get)]
+
+
 def find_item(element, array):
     for i in range(len(array)):
         if element in array[i]:
@@ -56,14 +180,14 @@ def all_equal(iterable):
     return next(g, True) and not next(g, False)
 
 
-def get_collapsed_activities(traces: List[List[Activity]]) -> List[Activity]:
+def get_collapsed_activities(traces: Iterable[Trace]) -> List[int]:
     activities = []
     candidates = []
-    for expanded_activity in sum(traces, []):
-        activity = expanded_activity.get_default()
-        if expanded_activity.event_type == "s":
+    for expanded_activity in itertools.chain.from_iterable(traces):
+        activity = expanded_activity & ~3
+        if expanded_activity & 3 == START:
             candidates += [activity]
-        elif expanded_activity.event_type == "c":
+        elif expanded_activity & 3 == COMPLETE:
             if activity in candidates:
                 activities += [activity]
                 candidates.remove(activity)
@@ -71,114 +195,377 @@ def get_collapsed_activities(traces: List[List[Activity]]) -> List[Activity]:
     return list(set(all_activities))
 
 
-def get_dfg_from_expanded_traces(traces: List[List[Activity]]) -> List[Tuple[Activity]]:
-    dfg = []
-    for trace in traces:
-        current_events = []  # tracker of which events are currently started but not completed
-        for i in range(len(trace) - 1):
-            label = trace[i].label
-            event_type = trace[i].event_type
-            source_activity = trace[i].get_default()
-            if event_type == "s":
-                current_events += [source_activity]
-                end_activity = trace[i].get_complete()
-                end_index = i + 1 if end_activity not in trace else trace.index(end_activity)
-                for j in range(i + 1, end_index):
-                    target_activity = trace[j].get_default()
-                    dfr = (source_activity, target_activity)
-                    if not any([gdfr[0].label == dfr[0].label and gdfr[1].label == dfr[1].label for gdfr in dfg]):
-                        dfg += [dfr]
-                    if is_complete_activity_in_trace(target_activity, trace[i:end_index]):
-                        dfr = (target_activity, source_activity)
-                        if not any([gdfr[0].label == dfr[0].label and gdfr[1].label == dfr[1].label for gdfr in dfg]):
-                            dfg += [dfr]
-
-            elif event_type == "c":
-                target_activity = trace[i].get_default()
-                if target_activity not in current_events:
-                    # print(f"{target_activity} completed but not started")
-                    pass
-                else:
-                    current_events.remove(target_activity)
-                started = []
-                for j in range(i + 1, len(trace)):
-                    current_label = trace[j].label
-                    current_event_type = trace[j].event_type
-                    # print(f"current_activity: {trace[i]} - {trace[j]}")
-                    if current_event_type == "s":
-                        dfr = (trace[i].get_default(), trace[j].get_default())
-                        # print(f"(2) Adding {label} -> {current_label}")
-                        if not any([gdfr[0].label == dfr[0].label and gdfr[1].label == dfr[1].label for gdfr in dfg]):
-                            dfg += [dfr]
-                        started += current_label
-                    if current_event_type == "c":
-                        dfr = (trace[i].get_default(), trace[j].get_default())
-                        # print(f"Adding {label} -> {current_label}")
-                        if not any([gdfr[0].label == dfr[0].label and gdfr[1].label == dfr[1].label for gdfr in dfg]):
-                            pass  # dfg += [dfr]
-                        if current_label in started:
-                            started = []
-                            # print(f"Breaking {trace[i]} and {trace[j]}")
-                            break
+class DirectlyFollowsGraph:
+    """Directly-follows relation with successor/predecessor maps, edge frequencies and start/end activity counts."""
+
+    def __init__(self):
+        self.successors: Dict[int, Dict[int, int]] = {}  # a -> {b: frequency of a -> b}
+        self.predecessors: Dict[int, Dict[int, int]] = {}  # b -> {a: frequency of a -> b}
+        self.start_activities: Dict[int, int] = {}
+        self.end_activities: Dict[int, int] = {}
+        self.edge_count = 0
+
+    def __contains__(self, edge) -> bool:
+        a, b = edge
+        return b in self.successors.get(a, ())
+
+    def __len__(self):
+        return self.edge_count
+
+    def __iter__(self):
+        for a, successors in self.successors.items():
+            for b in successors:
+                yield a, b
+
+    def __repr__(self):
+        return repr(list(self))
+
+    def add_edge(self, a: int, b: int, frequency: int = 1):
+        successors = self.successors.setdefault(a, {})
+        if b not in successors:
+            successors[b] = 0
+            self.predecessors.setdefault(b, {})[a] = 0
+            self.edge_count += 1
+        successors[b] += frequency
+        self.predecessors[b][a] += frequency
+
+    def remove_edge(self, a: int, b: int, frequency: int):
+        """Subtracts frequency from a -> b and removes the edge once it is not observed anymore."""
+        successors = self.successors[a]
+        successors[b] -= frequency
+        self.predecessors[b][a] -= frequency
+        if successors[b] <= 0:
+            del successors[b]
+            del self.predecessors[b][a]
+            self.edge_count -= 1
+            if not successors:
+                del self.successors[a]
+            if not self.predecessors[b]:
+                del self.predecessors[b]
+
+    def frequency(self, a: int, b: int) -> int:
+        return self.successors.get(a, {}).get(b, 0)
+
+
+def get_dfg_from_expanded_traces(variants: Variants, labels: List[str]) -> "DirectlyFollowsGraph":
+    """
+    Builds the lifecycle DFG in a single pass over every trace.
+
+    - A start event of x opens an interval until the first completion of x in the trace. Every event y inside yields
+      x -> y, and y -> x if y is started and completed inside the interval as well.
+    - A completion of x opens a scan, every later start event y yields x -> y. The scan is closed by a completion
+      whose label is one of the characters of the labels started since (labels: Alphabet.labels).
+
+    Edges are added in the order of their first occurrence (interval or scan, then event), since get_nodes_between
+    depends on the order of the successors.
+    """
+    dfg = DirectlyFollowsGraph()
+    label_chars = [set(label) for label in labels]
+    for trace, count in variants.items():
+        starts, ends = get_start_end_activities_from_trace(trace)
+        for a in starts:
+            dfg.start_activities[a] = dfg.start_activities.get(a, 0) + count
+        for a in ends:
+            dfg.end_activities[a] = dfg.end_activities.get(a, 0) + count
+
+        first_complete = {}
+        for j, e in enumerate(trace):
+            if e & 3 == COMPLETE and e & ~3 not in first_complete:
+                first_complete[e & ~3] = j
+
+        edges = {}  # (a, b) -> [(opened at, event, reverse), frequency]
+
+        def add_edge(a, b, key, frequency=1):
+            edge = edges.get((a, b))
+            if edge is None:
+                edges[(a, b)] = [key, frequency]
+            else:
+                edge[0] = min(edge[0], key)
+                edge[1] += frequency
+
+        intervals = []  # open intervals: (i, x, end, first event per activity, events per activity, started, completed)
+        scans = collections.deque()  # open scans (i, x), oldest first
+        open_scans: Dict[int, collections.deque] = {}  # x -> opened at of its open scans
+        last_started = {}  # character -> last start event of a label containing it
+        for j, e in enumerate(trace):
+            event_type, activity = e & 3, e & ~3
+            if intervals:
+                still_open = []
+                for interval in intervals:
+                    i, x, end, first, occurrences, started, completed = interval
+                    if end == j:
+                        for y, n in occurrences.items():
+                            if y in started and y in completed:
+                                add_edge(y, x, (i, first[y], 1), n)
+                        continue
+                    add_edge(x, activity, (i, j, 0))
+                    first.setdefault(activity, j)
+                    occurrences[activity] = occurrences.get(activity, 0) + 1
+                    if event_type == START:
+                        started.add(activity)
+                    elif event_type == COMPLETE:
+                        completed.add(activity)
+                    still_open.append(interval)
+                intervals = still_open
+
+            if event_type == START:
+                for x, opened in open_scans.items():
+                    if opened:
+                        add_edge(x, activity, (opened[0], j, 0), len(opened))
+                for character in label_chars[e >> 2]:
+                    last_started[character] = j
+                if first_complete.get(activity, -1) > j:
+                    intervals.append((j, activity, first_complete[activity], {}, {}, {activity}, set()))
+
+            elif event_type == COMPLETE:
+                label = labels[e >> 2]
+                if len(label) == 1:
+                    # scans opened before the last start of a label containing this one have to stop
+                    last = last_started.get(label, -1)
+                    while scans and scans[0][0] < last:
+                        _, x = scans.popleft()
+                        open_scans[x].popleft()
+                if j < len(trace) - 1:
+                    scans.append((j, activity))
+                    open_scans.setdefault(activity, collections.deque()).append(j)
+
+        for (a, b), (_, frequency) in sorted(edges.items(), key=lambda edge: edge[1][0]):
+            dfg.add_edge(a, b, frequency * count)
     return dfg
 
 
-def get_ccg_from_expanded_traces(traces: List[List[Activity]]) -> List[Set[Activity]]:
-    def overlap(a: Activity, b: Activity, trace: List[Activity]) -> bool:
-        start_activity, end_activity = a.get_start(), a.get_complete()
-        if start_activity not in trace: return False  # if only completion event exists, then it is atomic
-        i = trace.index(start_activity)
-        # Using Life Cycle Information in Process Discovery:
-        # "completion events are inserted right after unmatched start events" -> j = i+1
-        j = i + 1 if end_activity not in trace else trace.index(end_activity)
-        for activity in trace[i + 1:j]:
-            if b.label == activity.label:
-                return True
-        return False
+class ConcurrencyGraph:
+    """Symmetric concurrency relation of default activities as adjacency sets, with the number of traces per edge."""
 
-    def ccg_has_edge(ccg: List[Set[Activity]], a: Activity, b: Activity) -> bool:
-        for edge in ccg:
-            if a in edge and b in edge:
-                return True
-        return False
+    def __init__(self):
+        self.neighbours: Dict[int, Set[int]] = {}
+        self.frequencies: Dict[Tuple[int, int], int] = {}  # (a, b) with a <= b -> traces in which a, b are concurrent
+        self.edge_count = 0
 
-    ccg = []
-    for trace in traces:
-        for i, a in enumerate(trace):
-            for j, b in enumerate(trace):
-                if i != j and (overlap(a, b, trace) or overlap(b, a, trace)):
-                    a = a.get_default()
-                    b = b.get_default()
-                    if not ccg_has_edge(ccg, a, b):
-                        ccg.append({a, b})
-    # print(f"CCG: {ccg}")
+    def __contains__(self, edge) -> bool:
+        a, b = edge
+        return b in self.neighbours.get(a, ())
+
+    def __len__(self):
+        return self.edge_count
+
+    def __iter__(self):
+        for a, neighbours in self.neighbours.items():
+            for b in neighbours:
+                if a <= b:
+                    yield {a, b}
+
+    def __repr__(self):
+        return repr(list(self))
+
+    def add_edge(self, a: int, b: int, frequency: int = 1):
+        neighbours = self.neighbours.setdefault(a, set())
+        if b not in neighbours:
+            neighbours.add(b)
+            self.neighbours.setdefault(b, set()).add(a)
+            self.edge_count += 1
+        edge = (min(a, b), max(a, b))
+        self.frequencies[edge] = self.frequencies.get(edge, 0) + frequency
+
+    def remove_edge(self, a: int, b: int, frequency: int):
+        """Subtracts frequency from {a, b} and removes the edge once it is not observed anymore."""
+        edge = (min(a, b), max(a, b))
+        if edge not in self.frequencies:
+            return
+        self.frequencies[edge] -= frequency
+        if self.frequencies[edge] <= 0:
+            del self.frequencies[edge]
+            for x, y in {(a, b), (b, a)}:
+                self.neighbours[x].discard(y)
+                if not self.neighbours[x]:
+                    del self.neighbours[x]
+            self.edge_count -= 1
+
+    def frequency(self, a: int, b: int) -> int:
+        return self.frequencies.get((min(a, b), max(a, b)), 0)
+
+
+def get_ccg_from_expanded_traces(variants: Variants) -> ConcurrencyGraph:
+    """
+    Sweeps over every trace with the set of currently active activities. An activity is active after its first start
+    event until its first completion; every event of an activity b while a is active makes a and b concurrent.
+    """
+    ccg = ConcurrencyGraph()
+    for trace, count in variants.items():
+        first, second, first_start, first_complete = {}, {}, {}, {}
+        for i, e in enumerate(trace):
+            if e & ~3 not in first:
+                first[e & ~3] = i
+            elif e & ~3 not in second:
+                second[e & ~3] = i
+            events = first_start if e & 3 == START else first_complete if e & 3 == COMPLETE else None
+            if events is not None and e & ~3 not in events:
+                events[e & ~3] = i
+        # Using Life Cycle Information in Process Discovery:
+        # "completion events are inserted right after unmatched start events" -> active until i+1
+        windows, ends = {}, {}
+        for a, i in first_start.items():
+            end = first_complete.get(a, i + 1)
+            if end > i + 1:
+                windows[i] = a
+                ends.setdefault(end, []).append(a)
+
+        neighbours: Dict[int, Set[int]] = {}
+        active = set()
+        for i, e in enumerate(trace):
+            for a in ends.get(i, ()):
+                active.remove(a)
+            for a in active:
+                neighbours.setdefault(a, set()).add(e & ~3)
+                neighbours.setdefault(e & ~3, set()).add(a)
+            if i in windows:
+                active.add(windows[i])
+
+        for a, others in neighbours.items():
+            # An activity is only concurrent to itself if that is the first concurrency found for it, comparing the
+            # events pairwise in trace order (an edge {a} was only added if no edge contained a yet)
+            if a in others and a not in ccg.neighbours:
+                first_other = min((first[b] for b in others if b != a), default=len(trace))
+                if first[a] < first_other and second[a] < first_other:
+                    ccg.add_edge(a, a, count)
+            elif a in others and (a, a) in ccg:
+                ccg.add_edge(a, a, count)
+        for a, others in neighbours.items():
+            for b in others:
+                if a < b:
+                    ccg.add_edge(a, b, count)
     return ccg
 
 
-def reaches(a: Activity, b: Activity, dfg: List[Tuple[Activity]]) -> bool:
+def filter_dfg(dfg: DirectlyFollowsGraph, noise_threshold: float) -> DirectlyFollowsGraph:
+    """
+    IMf filtering: keeps the edges a -> b at least noise_threshold times as frequent as the most frequent edge leaving
+    a (ending the trace counts as leaving a), and the start/end activities at least noise_threshold times as frequent
+    as the most frequent one.
+    """
+    filtered = DirectlyFollowsGraph()
+    for a, successors in dfg.successors.items():
+        threshold = noise_threshold * max(max(successors.values()), dfg.end_activities.get(a, 0))
+        for b, frequency in successors.items():
+            if frequency >= threshold:
+                filtered.add_edge(a, b, frequency)
+    for activities, original in [(filtered.start_activities, dfg.start_activities),
+                                 (filtered.end_activities, dfg.end_activities)]:
+        threshold = noise_threshold * max(original.values(), default=0)
+        activities.update({a: count for a, count in original.items() if count >= threshold})
+    return filtered
+
+
+def filter_ccg(ccg: ConcurrencyGraph, noise_threshold: float) -> ConcurrencyGraph:
+    """Keeps the edges {a, b} at least noise_threshold times as frequent as the most frequent edge of a and of b."""
+    strongest = {}
+    for (a, b), frequency in ccg.frequencies.items():
+        for x in (a, b):
+            strongest[x] = max(strongest.get(x, 0), frequency)
+    filtered = ConcurrencyGraph()
+    for (a, b), frequency in ccg.frequencies.items():
+        if frequency >= noise_threshold * max(strongest[a], strongest[b]):
+            filtered.add_edge(a, b, frequency)
+    return filtered
+
+
+def reaches(a: int, b: int, dfg: DirectlyFollowsGraph) -> bool:
     visited = set()
 
-    def dfs(activity: Activity) -> bool:
+    def dfs(activity: int) -> bool:
         if activity == b:
             return True
         visited.add(activity)
-        for next_activity in [act for act in dfg if act[0] == activity]:
-            if next_activity[1] not in visited and dfs(next_activity[1]):
+        for next_activity in dfg.successors.get(activity, ()):
+            if next_activity not in visited and dfs(next_activity):
                 return True
         return False
 
     return dfs(a)
 
 
-def directly_reaches(a: Activity, b: Activity, dfg: List[Tuple[Activity]]) -> bool:
+def get_strongly_connected_components(dfg: DirectlyFollowsGraph, activities) -> List[List[int]]:
+    # Tarjan's algorithm, components are found in reverse topological order of the condensation DAG
+    index, low, stack, on_stack = {}, {}, [], set()
+    components = []
+    for root in activities:
+        if root in index:
+            continue
+        index[root] = low[root] = len(index)
+        stack.append(root)
+        on_stack.add(root)
+        work = [(root, iter(dfg.successors.get(root, ())))]
+        while work:
+            node, successors = work[-1]
+            for successor in successors:
+                if successor not in index:
+                    index[successor] = low[successor] = len(index)
+                    stack.append(successor)
+                    on_stack.add(successor)
+                    work.append((successor, iter(dfg.successors.get(successor, ()))))
+                    break
+                if successor in on_stack:
+                    low[node] = min(low[node], index[successor])
+            else:
+                work.pop()
+                if work:
+                    parent = work[-1][0]
+                    low[parent] = min(low[parent], low[node])
+                if low[node] == index[node]:
+                    component = []
+                    while True:
+                        a = stack.pop()
+                        on_stack.discard(a)
+                        component.append(a)
+                        if a == node:
+                            break
+                    components.append(component)
+    return components
+
+
+def get_component_reachability(dfg: DirectlyFollowsGraph, components: List[List[int]]) -> List[int]:
+    # Bitmask of the components reachable from each component (including itself),
+    # successors of a component are always found before the component itself
+    component_of = {a: i for i, component in enumerate(components) for a in component}
+    reachable = []
+    for i, component in enumerate(components):
+        mask = 1 << i
+        for a in component:
+            for b in dfg.successors.get(a, ()):
+                if component_of[b] != i:
+                    mask |= reachable[component_of[b]]
+        reachable.append(mask)
+    return reachable
+
+
+def get_connected_components(dfg: DirectlyFollowsGraph, activities) -> List[List[int]]:
+    visited = set()
+    components = []
+    for root in activities:
+        if root in visited:
+            continue
+        visited.add(root)
+        component, queue = [], [root]
+        while queue:
+            a = queue.pop()
+            component.append(a)
+            for b in itertools.chain(dfg.successors.get(a, ()), dfg.predecessors.get(a, ())):
+                if b not in visited:
+                    visited.add(b)
+                    queue.append(b)
+        components.append(component)
+    return components
+
+
+def directly_reaches(a: int, b: int, dfg: DirectlyFollowsGraph) -> bool:
     return (a, b) in dfg
 
 
-def is_concurrent(a: Activity, b: Activity, ccg: List[Set[Activity]]) -> bool:
-    return {a.get_default(), b.get_default()} in ccg
+def is_concurrent(a: int, b: int, ccg: ConcurrencyGraph) -> bool:
+    return (a & ~3, b & ~3) in ccg
 
 
-def are_concurrent(pa: Set[Activity], pb: Set[Activity], ccg: List[Set[Activity]]) -> bool:
+def are_concurrent(pa: Set[int], pb: Set[int], ccg: ConcurrencyGraph) -> bool:
     concurrent = True
     for a in pa:
         for b in pb:
@@ -187,27 +574,30 @@ def are_concurrent(pa: Set[Activity], pb: Set[Activity], ccg: List[Set[Activity]
     return concurrent
 
 
-def get_tau_activities():
-    return [Activity("τ", "s"), Activity("τ", "c")]
+def get_tau_activities() -> Trace:
+    return get_start(TAU), get_complete(TAU)
 
 
-def get_default_tau_activity():
-    return Activity("τ")
+def get_default_tau_activity() -> int:
+    return TAU
 
 
-def create_sublogs(traces, partitions):
-    grouped_traces = []
-    for trace in traces:
-        grouped_trace = [[] for _ in range(len(partitions))]
-        for event in trace:
-            for i, s in enumerate(partitions):
-                if event.get_default() in s:
-                    grouped_trace[i].append(event)
-                    break
-        grouped_traces.append(grouped_trace)
-    transposed = list(map(list, zip(*grouped_traces)))
-    with_taus = [[get_tau_activities() if not a else a for a in trace] for trace in transposed]
-    return with_taus
+def group_trace(trace, partitions) -> List[List[int]]:
+    grouped_trace = [[] for _ in range(len(partitions))]
+    for event in trace:
+        for i, s in enumerate(partitions):
+            if event & ~3 in s:
+                grouped_trace[i].append(event)
+                break
+    return [list(get_tau_activities()) if not a else a for a in grouped_trace]
+
+
+def create_sublogs(variants: Variants, partitions) -> List[Variants]:
+    sub_logs = [{} for _ in range(len(partitions))]
+    for trace, count in variants.items():
+        for sub_log, sub_trace in zip(sub_logs, group_trace(trace, partitions)):
+            add_variant(sub_log, sub_trace, count)
+    return sub_logs
 
 
 def create_loop_sublogs_old_2(traces, partitions):
@@ -218,7 +608,7 @@ def create_loop_sublogs_old_2(traces, partitions):
         current_sub_trace = []
         for a in trace:
             # print(f"Activitiy: {a}")
-            current_sub_log_index = partitions.index(find_item(a.get_default(), partitions))
+            current_sub_log_index = partitions.index(find_item(get_default(a), partitions))
             if latest_sub_log_index is None:
                 latest_sub_log_index = current_sub_log_index
             if latest_sub_log_index == current_sub_log_index:
@@ -232,9 +622,9 @@ def create_loop_sublogs_old_2(traces, partitions):
     return loop_sublogs
 
 
-def create_loop_sublogs(traces, partitions):
-    new_log = [[], []]  # do part, redo part
-    for trace in traces:
+def create_loop_sublogs(variants: Variants, partitions) -> List[Variants]:
+    new_log = [{}, {}]  # do part, redo part
+    for trace, count in variants.items():
         current_subtrace = []
         current_partition = None
         current_pi = None
@@ -243,14 +633,14 @@ def create_loop_sublogs(traces, partitions):
             activity_partition = None
             act_pi = None
             for i, part in enumerate(partitions):
-                if activity.get_default() in part:
+                if activity & ~3 in part:
                     activity_partition = part
                     act_pi = i
                     break
 
             if current_partition is not None and activity_partition != current_partition:
                 # print(f"Appending {current_subtrace} to PI: {current_pi}")
-                new_log[current_pi].append(current_subtrace)
+                add_variant(new_log[current_pi], current_subtrace, count)
                 current_subtrace = []
 
             current_subtrace.append(activity)
@@ -258,25 +648,44 @@ def create_loop_sublogs(traces, partitions):
             current_pi = act_pi
 
         # print(f"Appending {current_subtrace} to PI: {current_pi}")
-        new_log[current_pi].append(current_subtrace)
+        add_variant(new_log[current_pi], current_subtrace, count)
 
     return new_log
 
 
 def remove_taus_sub_logs(sub_logs, p):
-    ps = len(p)
-    for traces in sub_logs:
-        removed = 0
-        while get_tau_activities() in traces and removed < ps:
-            traces.remove(get_tau_activities())
-            removed += 1
+    tau = get_tau_activities()
+    for variants in sub_logs:
+        if tau in variants:
+            variants[tau] -= min(variants[tau], len(p))
+            if not variants[tau]:
+                del variants[tau]
     return sub_logs
 
 
 def remove_all_taus_sub_logs(sub_logs):
-    for traces in sub_logs:
-        while get_tau_activities() in traces:
-            traces.remove(get_tau_activities())
+    for variants in sub_logs:
+        variants.pop(get_tau_activities(), None)
+    return sub_logs
+
+
+def create_filtered_exclusive_sublogs(variants: Variants, partitions) -> List[Variants]:
+    """IMf: every trace goes to the partition with most of its events, the events of other partitions are dropped."""
+    sub_logs = [{} for _ in range(len(partitions))]
+    for trace, count in variants.items():
+        sub_traces = [[e for e in trace if e & ~3 in part] for part in partitions]
+        sub_trace = max(sub_traces, key=len)
+        if sub_trace:
+            add_variant(sub_logs[sub_traces.index(sub_trace)], sub_trace, count)
+    return sub_logs
+
+
+def remove_infrequent_taus_sub_logs(sub_logs, noise_threshold: float):
+    """IMf: empty traces less frequent than noise_threshold times the sublog size are dropped."""
+    tau = get_tau_activities()
+    for variants in sub_logs:
+        if tau in variants and len(variants) > 1 and variants[tau] < noise_threshold * sum(variants.values()):
+            del variants[tau]
     return sub_logs
 
 
@@ -301,11 +710,11 @@ def merge_sets(set_list, merge_instructions):
     return merged_set_list
 
 
-def collapsed_tau_traces_partitions(transposed_traces, partitions):
-    collapsed_traces = []
+def collapsed_tau_traces_partitions(transposed_traces: Variants, partitions):
+    collapsed_traces = {}
     tau_s, tau_c = get_tau_activities()
     collapsed_activities = []
-    for j, trace in enumerate(transposed_traces):
+    for j, (trace, count) in enumerate(transposed_traces.items()):
         collapsed_partition = set()
         collapsed_trace = []
         started_tau, completed_tau = False, False
@@ -324,8 +733,8 @@ def collapsed_tau_traces_partitions(transposed_traces, partitions):
                     else:
                         pass  # do not add it
 
-                activities = set(sum([[act.get_default() for x, act in enumerate(trace) if
-                                       (x == i and act.get_default() != get_default_tau_activity())] for y, trace in
+                activities = set(sum([[act & ~3 for x, act in enumerate(trace) if
+                                       (x == i and act & ~3 != get_default_tau_activity())] for y, trace in
                                       enumerate(transposed_traces)], []))
                 collapsed_partition |= activities
             else:
@@ -335,30 +744,29 @@ def collapsed_tau_traces_partitions(transposed_traces, partitions):
                 collapsed_partition = set()
                 started_tau, completed_tau = False, False
 
-        collapsed_traces += [collapsed_trace]
+        add_variant(collapsed_traces, collapsed_trace, count)
     return collapsed_traces, merge_sets(partitions, collapsed_activities)
 
 
-def get_start_end_activities_from_trace(trace: List[Activity]) -> Tuple[List[Activity], List[Activity]]:
+def get_start_end_activities_from_trace(trace: Trace) -> Tuple[List[int], List[int]]:
     starts = []
     for a in trace:
-        if a.event_type == "c":
+        if a & 3 == COMPLETE:
             break
-        activity = a.get_default()
+        activity = a & ~3
         if activity not in starts:
             starts += [activity]
     ends = []
     for a in trace[::-1]:
-        if a.event_type == "s":
+        if a & 3 == START:
             break
-        activity = a.get_default()
-        if activity not in starts:
+        activity = a & ~3
+        if activity not in starts and activity not in ends:
             ends += [activity]
     return starts, ends
 
 
-def get_start_end_activities_from_traces(traces: List[List[Activity]], ignore_tau=False) -> Tuple[
-    Set[Activity], Set[Activity]]:
+def get_start_end_activities_from_traces(traces: Iterable[Trace], ignore_tau=False) -> Tuple[Set[int], Set[int]]:
     start_activities = []
     end_activities = []
     for trace in traces:
@@ -386,18 +794,16 @@ def get_start_end_activities_from_traces(traces: List[List[Activity]], ignore_ta
     return common_start_activities, common_end_activities
 
 
-def concurrent_start_end_activities(traces, p, root_dfg) -> bool:
+def concurrent_start_end_activities(traces, p, root_dfg: DirectlyFollowsGraph) -> bool:
     outside_activities = set(get_collapsed_activities(traces)) - set().union(*p)
     start_activities = sum(
-        [[set([target for source, target in root_dfg if target.label == a.label]) for a in part] for part in p], [])
+        [[{a} if root_dfg.predecessors.get(a) else set() for a in part] for part in p], [])
     end_activities = sum(
-        [[set([source for source, target in root_dfg if source.label == a.label]) for a in part] for part in p], [])
+        [[{a} if root_dfg.successors.get(a) else set() for a in part] for part in p], [])
     start_sources = sum(
-        [[set([source for source, target in root_dfg if target.label == a.label]) & outside_activities for a in part]
-         for part in p], [])
+        [[set(root_dfg.predecessors.get(a, ())) & outside_activities for a in part] for part in p], [])
     end_targets = sum(
-        [[set([target for source, target in root_dfg if source.label == a.label]) & outside_activities for a in part]
-         for part in p], [])
+        [[set(root_dfg.successors.get(a, ())) & outside_activities for a in part] for part in p], [])
     root_starts, root_ends = get_start_end_activities_from_traces(traces)
 
     # print(p, start_activities, end_activities, start_sources, end_targets, root_starts, root_ends)
@@ -465,52 +871,51 @@ def concurrent_start_end_activities(traces, p, root_dfg) -> bool:
     return True
 
 
-def is_complete_activity_in_trace(a: Activity, trace: List[Activity]) -> bool:
+def is_complete_activity_in_trace(a: int, trace: Trace) -> bool:
     start, end = False, False
     for act in trace:
-        if act.label == a.label:
-            if act.event_type == "s":
+        if act >> 2 == a >> 2:
+            if act & 3 == START:
                 start = True
-            if act.event_type == "c":
+            if act & 3 == COMPLETE:
                 end = True
         if start and end:
             return True
     return start and end
 
 
-def remove_latest_element(activity: Activity, input_list: List[Tuple[Activity, int]]):
+def remove_latest_element(activity: int, input_list: List[Tuple[int, int]]):
     for i in range(len(input_list) - 1, -1, -1):
         if input_list[i][0] == activity:
             del input_list[i]
             break
 
 
-def correct_incomplete_traces(traces: List[List[Activity]]) -> List[List[Activity]]:
+def correct_incomplete_traces(variants: Variants) -> Variants:
     # Incomplete events are handled as atomic events.
-    corrected_traces = []
-    original_traces = [[a for a in t] for t in traces]
+    corrected_traces = {}
 
-    for i, trace in enumerate(original_traces):
+    for trace, count in variants.items():
         corrected_trace = []
         active_activities = []
         added_activities = 0
 
         for j, activity in enumerate(trace):
-            if activity.event_type == "s":
-                active_activities += [(activity.get_default(), j + added_activities)]
-            elif activity.event_type == "c":
-                if activity.get_default() not in [a for a, _ in active_activities]:
-                    corrected_trace += [activity.get_start()]
+            if activity & 3 == START:
+                active_activities += [(activity & ~3, j + added_activities)]
+            elif activity & 3 == COMPLETE:
+                if activity & ~3 not in [a for a, _ in active_activities]:
+                    corrected_trace += [get_start(activity)]
                     added_activities += 1
                 else:
-                    remove_latest_element(activity.get_default(), active_activities)
+                    remove_latest_element(activity & ~3, active_activities)
             corrected_trace += [activity]
 
         j = 0
         for a, k in active_activities:
-            corrected_trace.insert(k + (j := j + 1), a.get_complete())
+            corrected_trace.insert(k + (j := j + 1), get_complete(a))
 
-        corrected_traces += [corrected_trace]
+        add_variant(corrected_traces, corrected_trace, count)
     return corrected_traces
 
 
@@ -534,14 +939,13 @@ def are_concurrent_p(ccg, p):
     return True
 
 
-def is_valid_loop(do_set, redo_set, log, dfg, debug=False):
-    do_start, do_end = get_start_end_activities_from_traces(
-        [sum([[a] for a in trace if a.get_default() in do_set], []) for trace in log])
+def is_valid_loop(do_set, redo_set, log, dfg, do_start: Set[int], do_end: Set[int], debug=False):
+    """The start/end activities of the log are those of the do part, which includes them."""
     redo_start, redo_end = get_start_end_activities_from_traces(
-        [sum([[a] for a in trace if a.get_default() in redo_set], []) for trace in log], True)
+        [sum([[a] for a in trace if a & ~3 in redo_set], []) for trace in log], True)
     if debug:
         print(do_set, do_end, redo_start, redo_end)
-        print("Redo traces:", [sum([[a] for a in trace if a.get_default() in redo_set], []) for trace in log])
+        print("Redo traces:", [sum([[a] for a in trace if a & ~3 in redo_set], []) for trace in log])
     if 0 in [len(p) for p in [do_start, do_end, redo_start, redo_end]]:
         return False
     for b in redo_start:
@@ -558,13 +962,8 @@ def is_valid_loop(do_set, redo_set, log, dfg, debug=False):
     return True
 
 
-def get_nodes_between(x, y, dfg):
-    adj_list = {}
-    for edge in dfg:
-        u, v = edge
-        if u not in adj_list:
-            adj_list[u] = []
-        adj_list[u].append(v)
+def get_nodes_between(x, y, dfg: DirectlyFollowsGraph):
+    adj_list = dfg.successors
 
     def dfs(node, target, visited, path):
         visited.add(node)
@@ -586,49 +985,216 @@ def get_nodes_between(x, y, dfg):
     return set(result_path) - {x, y}
 
 
-def extend_loop_cut_old(do_set, redo_set, log, dfg):
-    new_do, new_redo = False, False
-    for b in redo_set:
-        new_do, new_redo = do_set | {b}, redo_set - {b}
-        if is_valid_loop(new_do, new_redo, log, dfg):
-            return [new_do, new_redo]
+def get_loop_partitions(variants: Variants, activities, start_activities: Set[int], end_activities: Set[int]):
+    """
+    Loop cut by component construction, linear in the log: the start and end activities form the do part, the
+    connected components of the remaining directly-follows graph are redo parts unless one of their occurrences in a
+    trace is not entered from an end activity or not left to a start activity (or starts/ends the trace), then they
+    join the do part. Returns do_set, redo_set.
+
+    The components are built from consecutive events rather than the lifecycle DFG, where completions are followed
+    by all later starts and would connect the body with the redo part.
+    """
+    do_set = set(start_activities) | set(end_activities)
+    partitions = DisjointSet([a for a in activities if a not in do_set])
+    for trace in variants:
+        for a, b in zip(trace, trace[1:]):
+            if a & ~3 not in do_set and b & ~3 not in do_set:
+                partitions.union(a & ~3, b & ~3)
+    components = partitions.partitions()
+    component_of = {a: i for i, component in enumerate(components) for a in component}
+
+    redo = [True] * len(components)
+    for trace in variants:
+        previous = None  # activity of the event before the current run
+        current = None  # component of the current run
+        for event in trace:
+            component = component_of.get(event & ~3)
+            if component != current:
+                if current is not None and event & ~3 not in start_activities:
+                    redo[current] = False
+                if component is not None and (previous is None or previous not in end_activities):
+                    redo[component] = False
+                current = component
+            previous = event & ~3
+        if current is not None:
+            redo[current] = False
+
+    redo_set = set()
+    for component, is_redo in zip(components, redo):
+        if is_redo:
+            redo_set |= component
         else:
-            new_do, new_redo = extend_loop_cut(new_do, new_redo, log, dfg)
-    return [new_do, new_redo]
+            do_set |= component
+    return do_set, redo_set
 
 
-def extend_loop_cut(do_set, redo_set, log, dfg):
-    max_do, max_redo = do_set, redo_set
-    for b in redo_set:
-        new_do, new_redo = do_set | {b}, redo_set - {b}
-        if is_valid_loop(new_do, new_redo, log, dfg):
-            max_do, max_redo = new_do, new_redo
-            new_max_do, new_max_redo = extend_loop_cut(new_do, new_redo, log, dfg)
-            if len(new_max_do) > len(max_do):
-                max_do, max_redo = new_max_do, new_max_redo
-    return max_do, max_redo
+class SubtreeCache:
+    """
+    Bounded LRU cache of mined subtrees: fingerprint of a sublog -> (cut type, partition, sub-miners).
+
+    The sub-miners are only read after mining, so a cached subtree can be shared by the trees of several refreshes.
+    """
 
+    def __init__(self, maxsize=1024):
+        self.maxsize = maxsize
+        self.entries = collections.OrderedDict()
+        self.lock = threading.Lock()
+        self.hits, self.misses = 0, 0
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __repr__(self):
+        return f"SubtreeCache(hits={self.hits}, misses={self.misses}, size={len(self)}/{self.maxsize})"
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return entry
+
+    def put(self, key, entry):
+        with self.lock:
+            self.entries[key] = entry
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.maxsize:
+                self.entries.popitem(last=False)
+
+    def stats(self) -> Dict[str, int]:
+        return {"hits": self.hits, "misses": self.misses, "size": len(self), "maxsize": self.maxsize}
+
+
+subtree_cache = SubtreeCache()
+
+
+def get_log_size(variants: Variants) -> int:
+    return sum(len(trace) for trace in variants)
+
+
+def mine_sublog(miner: "InductiveMinerLifeCycle", debug=False) -> "InductiveMinerLifeCycle":
+    miner.find_sublogs_cuts(debug)
+    return miner
+
+
+def init_sublog_worker():
+    # workers import the app again, they must not start pools of their own
+    global subtree_cache
+    subtree_cache = SubtreeCache(subtree_cache.maxsize)
+    sublog_executor.workers = 0
+
+
+class SublogExecutor:
+    """
+    Mines sibling sublogs concurrently in a process pool. Only sublogs with at least min_size events (summed over the
+    variants) go to the pool, smaller ones are mined inline since pickling would outweigh the gain. workers=0 mines
+    everything inline.
+
+    The workers are started by a fork server (or spawned), not forked from the threads of the server. Sublogs the
+    pool did not mine within timeout seconds are mined inline, and the pool is replaced.
+    """
+
+    def __init__(self, workers=0, min_size=2000, timeout=60.0):
+        self.workers = workers
+        self.min_size = min_size
+        self.timeout = timeout
+        self.pool = None
+        self.lock = threading.Lock()
+
+    def configure(self, workers=None, min_size=None, timeout=None):
+        if workers is not None and workers != self.workers:
+            self.workers = workers
+            self.reset_pool()
+        if min_size is not None:
+            self.min_size = min_size
+        if timeout is not None:
+            self.timeout = timeout
+
+    def get_pool(self) -> concurrent.futures.ProcessPoolExecutor:
+        with self.lock:
+            if self.pool is None:
+                method = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+                self.pool = concurrent.futures.ProcessPoolExecutor(
+                    self.workers, mp_context=multiprocessing.get_context(method), initializer=init_sublog_worker)
+            return self.pool
+
+    def reset_pool(self):
+        """Drops the pool (a hung worker is left behind), the next sublogs start a new one."""
+        with self.lock:
+            if self.pool is not None:
+                self.pool.shutdown(wait=False, cancel_futures=True)
+                self.pool = None
+
+    def mine(self, miners: List["InductiveMinerLifeCycle"], debug=False) -> List["InductiveMinerLifeCycle"]:
+        """Mines the miners and returns them in the same order, miners mined in the pool are replaced by the result."""
+        large = [i for i, miner in enumerate(miners)
+                 if miner.cut_type == CutType.UNKNOWN and get_log_size(miner.log) >= self.min_size]
+        if self.workers <= 0 or len(large) < 2:
+            for miner in miners:
+                miner.find_sublogs_cuts(debug)
+            return miners
+
+        fingerprints = {i: miners[i].fingerprint() for i in large}  # the log of a mined miner are its children
+        futures = {i: self.get_pool().submit(mine_sublog, miners[i], debug) for i in large}
+        for i, miner in enumerate(miners):
+            if i not in futures:
+                miner.find_sublogs_cuts(debug)
+        mined = list(miners)
+        deadline = time.monotonic() + self.timeout
+        for i, future in futures.items():
+            try:
+                mined[i] = future.result(max(deadline - time.monotonic(), 0))
+            except Exception as e:
+                print(f"Mining sublog in the pool failed, mining inline: {e!r}")
+                if isinstance(e, (concurrent.futures.TimeoutError, concurrent.futures.BrokenExecutor)):
+                    self.reset_pool()
+                mined[i].find_sublogs_cuts(debug)
+                continue
+            # the subtree was cached in the worker, remember it here as well
+            subtree_cache.put(fingerprints[i], (mined[i].cut_type, mined[i].cut_partition, mined[i].log))
+        return mined
+
+
+sublog_executor = SublogExecutor(int(os.environ.get("IMLC_WORKERS", 0)),
+                                 int(os.environ.get("IMLC_MIN_SUBLOG_SIZE", 2000)),
+                                 float(os.environ.get("IMLC_POOL_TIMEOUT", 60)))
+
+# IMf noise threshold in [0, 1], 0 disables filtering
+default_noise_threshold = float(os.environ.get("IMLC_NOISE_THRESHOLD", 0))
 
 
 class InductiveMinerLifeCycle:
-    def __init__(self, traces, root_dfg=None):
-        traces = correct_incomplete_traces(traces)
-        self.dfg = get_dfg_from_expanded_traces(traces)
-        self.root_dfg = root_dfg if root_dfg else get_dfg_from_expanded_traces(traces)
+    def __init__(self, traces, root_dfg=None, alphabet=None, noise_threshold=None):
+        # traces: list of Activity traces, or encoded traces/Variants of the given alphabet (sublogs)
+        # noise_threshold: infrequent behaviour filtering (IMf) before cut detection, see find_filtered_cut
+        if alphabet is None:
+            alphabet = Alphabet()
+            traces = alphabet.encode_traces(traces)
+        self.alphabet = alphabet
+        self.noise_threshold = default_noise_threshold if noise_threshold is None else noise_threshold
+        traces = correct_incomplete_traces(get_variants(traces))
+        self.dfg = get_dfg_from_expanded_traces(traces, alphabet.labels)
+        self.root_dfg = root_dfg if root_dfg else get_dfg_from_expanded_traces(traces, alphabet.labels)
         self.ccg = get_ccg_from_expanded_traces(traces)
         self.activities = get_collapsed_activities(traces)
 
         self.log = traces
         self.cut_type = CutType.UNKNOWN
+        self.cut_partition = None
 
         self.apply_base_case()
         self.built_process_tree = False
         self.debug = False
+        self.depth = 0  # recursion depth of the sublog, for instrumentation
 
     @property
     def process_tree(self):
         if self.cut_type == CutType.MINIMAL:
-            return "" + "τ" if not len(self.activities) else str(self.activities[0].get_default()) + ""
+            return "" + "τ" if not len(self.activities) else str(self.alphabet.decode(self.activities[0])) + ""
         if not self.built_process_tree: return "[!] No process tree available. Use find_sublog_cuts first."
         try:
             return self.cut_type.value + "(" + ",".join([m.process_tree for m in self.log]) + ")"
@@ -638,70 +1204,126 @@ class InductiveMinerLifeCycle:
     def find_sublogs_cuts(self, debug=False):
         self.debug = debug
         # print(f"Finding Cuts for: {self.log}")
+        instrumentation.record_node(self.depth)
         if self.cut_type != CutType.UNKNOWN:
             self.built_process_tree = True
             return
-        cut_type = CutType.UNKNOWN
-        sub_logs, cut_partition = None, None
-        if self.cut_type == CutType.UNKNOWN:
-            sub_logs, cut_partition, cut_type = self.find_sequence_cuts()
-        if cut_type == CutType.UNKNOWN:
-            sub_logs, cut_partition, cut_type = self.find_interleaved_cuts()
-        if cut_type == CutType.UNKNOWN:
-            sub_logs, cut_partition, cut_type = self.find_parallel_cuts()
-        if cut_type == CutType.UNKNOWN:
-            sub_logs, cut_partition, cut_type = self.find_exclusive_cuts()
+        fingerprint = self.fingerprint()
+        cached = subtree_cache.get(fingerprint)
+        if cached is not None:
+            self.cut_type, self.cut_partition, self.log = cached
+            if self.debug:
+                print(f"[=] {self.cut_type.value}{self.alphabet.decode_partitions(self.cut_partition or [])} - cached")
+            self.built_process_tree = True
+            return self.log if self.cut_partition is not None else None
+        sub_logs, cut_partition, cut_type = None, None, CutType.UNKNOWN
+        if self.noise_threshold > 0:
+            sub_logs, cut_partition, cut_type = self.find_filtered_cut()
         if cut_type == CutType.UNKNOWN:
-            sub_logs, cut_partition, cut_type = self.find_loop_cut()
+            sub_logs, cut_partition, cut_type = self.find_cut()
         if cut_type == CutType.UNKNOWN:
             self.assign_fall_through()
             self.built_process_tree = True
+            subtree_cache.put(fingerprint, (self.cut_type, None, self.log))
             return
         if self.debug:
-            print(f"[+] {cut_type.value}{cut_partition} - Traces: {self.log}")
+            print(f"[+] {cut_type.value}{self.alphabet.decode_partitions(cut_partition)} - "
+                  f"Traces: {self.alphabet.decode_variants(self.log)}")
         self.cut_type = cut_type
+        self.cut_partition = cut_partition
 
-        new_imlcs = [InductiveMinerLifeCycle(log, self.root_dfg) for log in sub_logs]
-
-        self.log = new_imlcs
+        if self.noise_threshold > 0:
+            sub_logs = remove_infrequent_taus_sub_logs(sub_logs, self.noise_threshold)
+        instrumentation.record_sublogs([get_log_size(log) for log in sub_logs])
+        new_imlcs = [self.sub_miner(log) for log in sub_logs]
 
-        for imlc in new_imlcs:
-            imlc.find_sublogs_cuts(self.debug)
+        self.log = sublog_executor.mine(new_imlcs, self.debug)
 
         self.built_process_tree = True
+        subtree_cache.put(fingerprint, (self.cut_type, self.cut_partition, self.log))
         return self.log
 
+    def sub_miner(self, log) -> "InductiveMinerLifeCycle":
+        miner = InductiveMinerLifeCycle(log, self.root_dfg, self.alphabet, self.noise_threshold)
+        miner.depth = self.depth + 1
+        return miner
+
+    def fingerprint(self):
+        """
+        Everything the subtree of this sublog depends on: the variants in order (cuts are order sensitive) with their
+        counts, the labels and names of the activities (IDs repeat across process models with other names) and whether
+        they have predecessors/successors in the root DFG (concurrent_start_end_activities).
+
+        Without a noise threshold, counts only matter for the τ variants of sublogs, which parallel cuts reduce by the
+        number of partitions: less than twice the number of activities in total, larger counts are all the same.
+        """
+        activities = sorted(self.activities)
+        if self.noise_threshold > 0:
+            log = tuple(self.log.items())
+        else:
+            log = tuple((trace, min(count, 2 * len(activities))) for trace, count in self.log.items())
+        return (log, self.noise_threshold,
+                tuple((self.alphabet.labels[a >> 2], self.alphabet.names[a >> 2]) for a in activities),
+                tuple((bool(self.root_dfg.predecessors.get(a)), bool(self.root_dfg.successors.get(a)))
+                      for a in activities))
+
+    def find_cut(self):
+        for cut, find_cut in [("sequence", self.find_sequence_cuts), ("interleaved", self.find_interleaved_cuts),
+                              ("parallel", self.find_parallel_cuts), ("exclusive", self.find_exclusive_cuts),
+                              ("loop", self.find_loop_cut)]:
+            start = time.perf_counter()
+            sub_logs, cut_partition, cut_type = find_cut()
+            instrumentation.record_cut_attempt(cut, time.perf_counter() - start, cut_type != CutType.UNKNOWN)
+            if cut_type != CutType.UNKNOWN:
+                return sub_logs, cut_partition, cut_type
+        return None, None, CutType.UNKNOWN
+
+    def find_filtered_cut(self):
+        """
+        IMf: looks for a cut on the DFG and CCG without their infrequent edges (filter_dfg, filter_ccg). The sublogs of
+        an exclusive cut are split by majority instead, other cuts already project the deviating events away.
+        """
+        dfg, ccg = self.dfg, self.ccg
+        self.dfg, self.ccg = filter_dfg(dfg, self.noise_threshold), filter_ccg(ccg, self.noise_threshold)
+        try:
+            sub_logs, cut_partition, cut_type = self.find_cut()
+        finally:
+            self.dfg, self.ccg = dfg, ccg
+        if cut_type == CutType.EXCLUSIVE:
+            sub_logs = create_filtered_exclusive_sublogs(self.log, cut_partition)
+            kept = [i for i, sub_log in enumerate(sub_logs) if sub_log]
+            if len(kept) < 2:
+                return None, None, CutType.UNKNOWN
+            sub_logs, cut_partition = [sub_logs[i] for i in kept], [cut_partition[i] for i in kept]
+        if self.debug and cut_type != CutType.UNKNOWN:
+            print(f"[~] {cut_type.value}{self.alphabet.decode_partitions(cut_partition)} - filtered")
+        return sub_logs, cut_partition, cut_type
+
     def find_sequence_cuts(self):
         if len(self.dfg) == 0:
             return None, None, CutType.UNKNOWN
-        p = [{n} for n in self.activities]
-
-        for a in self.activities:
-            for b in self.activities:
-                if reaches(a, b, self.dfg) and reaches(b, a, self.dfg):  # and a != b:
-                    # print(f"No sequence cut - pairwise reachable: {a}, {b}")
-                    pa = find_item(a, p)
-                    pb = find_item(b, p)
-                    if pa != pb:
-                        p.remove(pa)
-                        p.remove(pb)
-                        p.append(pa | pb)
-
-                if not reaches(a, b, self.dfg) and not reaches(b, a, self.dfg):  # and a != b:
-                    # print(f"No sequence cut: {a}, {b}")
-                    pa = find_item(a, p)
-                    pb = find_item(b, p)
-                    if pa != pb:
-                        p.remove(pa)
-                        p.remove(pb)
-                        p.append(pa | pb)
+        # pairwise reachable activities form the strongly connected components,
+        # components that can not reach each other in the condensation DAG end up in the same partition
+        components = get_strongly_connected_components(self.dfg, self.activities)
+        reachable = get_component_reachability(self.dfg, components)
+        component_of = {a: i for i, component in enumerate(components) for a in component}
+        partitions = DisjointSet(groups=components)
+        for i in range(len(components)):
+            for j in range(i + 1, len(components)):
+                if not reachable[i] >> j & 1 and not reachable[j] >> i & 1:
+                    # print(f"No sequence cut: {components[i]}, {components[j]}")
+                    partitions.union(components[i][0], components[j][0])
+        p = partitions.partitions()
 
         if len(p) == 1:
             return None, None, CutType.UNKNOWN
 
         # sort for reachability
         def reachability_sort(pa, pb):
-            if all(reaches(a, b, self.dfg) for a in pa for b in pb):
+            pb_components = 0
+            for b in pb:
+                pb_components |= 1 << component_of[b]
+            if all(reachable[component_of[a]] & pb_components == pb_components for a in pa):
                 return -1  # pa < pb: pa -> pb
             else:
                 return 1  # pa >= pb
@@ -709,9 +1331,9 @@ class InductiveMinerLifeCycle:
         p = sorted(p, key=functools.cmp_to_key(reachability_sort))
 
         # In sublogs with traces with > 1 consecutive taus, these will be merged, partitions respectively
-        sub_logs = create_sublogs(self.log, p)
-
-        transposed_logs = [sum(list(trace), []) for trace in list(zip(*sub_logs))]  # old traces
+        transposed_logs = {}  # old traces
+        for trace, count in self.log.items():
+            add_variant(transposed_logs, sum(group_trace(trace, p), []), count)
         collapsed_traces, new_partitions = collapsed_tau_traces_partitions(transposed_logs, p)
         p = sorted(new_partitions, key=functools.cmp_to_key(reachability_sort))
         sub_logs = create_sublogs(collapsed_traces, p)
@@ -720,37 +1342,28 @@ class InductiveMinerLifeCycle:
         return sub_logs, p, CutType.SEQUENCE
 
     def find_interleaved_cuts(self):
-        p = [{n} for n in self.activities]
-        np = [{n} for n in self.activities]
-        for a in self.activities:
-            for b in self.activities:
-                if not directly_reaches(a, b, self.dfg) or not directly_reaches(b, a, self.dfg):  # and a != b:
-                    # if not is_concurrent(a, b, self.ccg):  # and a != b:
-                    pa = find_item(a, p)
-                    pb = find_item(b, p)
-                    if pa != pb:
-                        p.remove(pa)
-                        p.remove(pb)
-                        p.append(pa | pb)
+        partitions = DisjointSet(self.activities)
+        for i, a in enumerate(self.activities):
+            for b in self.activities[i + 1:]:
+                if not directly_reaches(a, b, self.dfg) or not directly_reaches(b, a, self.dfg):
+                    # if not is_concurrent(a, b, self.ccg):
+                    partitions.union(a, b)
+        p = partitions.partitions()
 
         # Check for same start and end activities
-        concurrent_start_end_activities(self.log, p, self.root_dfg)
         if not concurrent_start_end_activities(self.log, p, self.root_dfg):
             return None, None, CutType.UNKNOWN
 
         concurrent = are_concurrent_p(self.ccg, p)
 
         if not concurrent:
-            for a in self.activities:
-                for b in self.activities:
-                    # if not reaches(a, b, self.dfg) or not reaches(b, a, self.dfg):  # and a != b:
-                    if not is_concurrent(a, b, self.ccg):  # and a != b:
-                        npa = find_item(a, np)
-                        npb = find_item(b, np)
-                        if npa != npb:
-                            np.remove(npa)
-                            np.remove(npb)
-                            np.append(npa | npb)
+            concurrent_partitions = DisjointSet(self.activities)
+            for i, a in enumerate(self.activities):
+                for b in self.activities[i + 1:]:
+                    # if not reaches(a, b, self.dfg) or not reaches(b, a, self.dfg):
+                    if not is_concurrent(a, b, self.ccg):
+                        concurrent_partitions.union(a, b)
+            np = concurrent_partitions.partitions()
             if len(np) > 1:
                 p = np
                 if are_concurrent_p(self.ccg, p):
@@ -771,17 +1384,13 @@ class InductiveMinerLifeCycle:
         return sub_logs, p, CutType.INTERLEAVING if not concurrent else CutType.PARALLEL
 
     def find_parallel_cuts(self):
-        p = [{n} for n in self.activities]
-        for a in self.activities:
-            for b in self.activities:
-                # if not reaches(a, b, self.dfg) or not reaches(b, a, self.dfg):  # and a != b:
-                if not is_concurrent(a, b, self.ccg):  # and a != b:
-                    pa = find_item(a, p)
-                    pb = find_item(b, p)
-                    if pa != pb:
-                        p.remove(pa)
-                        p.remove(pb)
-                        p.append(pa | pb)
+        partitions = DisjointSet(self.activities)
+        for i, a in enumerate(self.activities):
+            for b in self.activities[i + 1:]:
+                # if not reaches(a, b, self.dfg) or not reaches(b, a, self.dfg):
+                if not is_concurrent(a, b, self.ccg):
+                    partitions.union(a, b)
+        p = partitions.partitions()
 
         if len(p) == 1:
             return None, None, CutType.UNKNOWN
@@ -791,16 +1400,8 @@ class InductiveMinerLifeCycle:
         return sub_logs, p, CutType.PARALLEL
 
     def find_exclusive_cuts(self):
-        p = [{n} for n in self.activities]
-        for a in self.activities:
-            for b in self.activities:
-                if reaches(a, b, self.dfg) or reaches(b, a, self.dfg):  # and a != b:
-                    pa = find_item(a, p)
-                    pb = find_item(b, p)
-                    if pa != pb:
-                        p.remove(pa)
-                        p.remove(pb)
-                        p.append(pa | pb)
+        # activities where one reaches the other are exactly the connected components of the undirected DFG
+        p = [set(component) for component in get_connected_components(self.dfg, self.activities)]
 
         if len(p) == 1:
             return None, None, CutType.UNKNOWN
@@ -810,17 +1411,18 @@ class InductiveMinerLifeCycle:
         return sub_logs, p, CutType.EXCLUSIVE
 
     def find_loop_cut(self):
-        start_activities, end_activities = get_start_end_activities_from_traces(self.log)
-        do_set = set(start_activities) | set(end_activities)  # Start do_set with start/end activities
+        # start/end activities of any trace, for the initial split, its check and the components alike
+        starts, ends = set(), set()
+        for trace in self.log:
+            starts |= {a & ~3 for a in itertools.takewhile(lambda a: a & 3 != COMPLETE, trace)}
+            ends |= {a & ~3 for a in itertools.takewhile(lambda a: a & 3 != START, reversed(trace))}
+        do_set = starts | ends  # Start do_set with start/end activities
         redo_set = set(self.activities) - do_set
 
-        # move nodes from redo set to do set if they violate any loop cut conditions
+        # components of the redo set that violate any loop cut conditions are moved to the do set
         # If ∃x->a <=> ∃b->a AND if b->∃a <=> ∃x->a
-        if not is_valid_loop(do_set, redo_set, self.log, self.dfg):
-            new_do, new_redo = extend_loop_cut(do_set, redo_set, self.log, self.dfg)
-            do_set, redo_set = new_do, new_redo
-            if not new_do and not new_redo:
-                return None, None, CutType.UNKNOWN
+        if not is_valid_loop(do_set, redo_set, self.log, self.dfg, starts, ends):
+            do_set, redo_set = get_loop_partitions(self.log, self.activities, starts, ends)
 
         if len(do_set) > 0 and len(redo_set) > 0:
             p = [do_set, redo_set]
@@ -831,39 +1433,41 @@ class InductiveMinerLifeCycle:
     def assign_fall_through(self):
         if self.debug:
             print(
-                f"[-] Applying fallthrough for log: {self.log} - {'empty_trace' if get_tau_activities() in self.log else 'flower_model'}")
+                f"[-] Applying fallthrough for log: {self.alphabet.decode_variants(self.log)} - {'empty_trace' if get_tau_activities() in self.log else 'flower_model'}")
 
         def empty_trace():
             new_traces = [[get_tau_activities()],
-                          [trace for trace in self.log if trace != get_tau_activities()]]
-            tau_imlc = InductiveMinerLifeCycle(new_traces[0], self.root_dfg)
-            non_tau_imlc = InductiveMinerLifeCycle(new_traces[1], self.root_dfg)
+                          {trace: count for trace, count in self.log.items() if trace != get_tau_activities()}]
+            tau_imlc = self.sub_miner(new_traces[0])
+            non_tau_imlc = self.sub_miner(new_traces[1])
             self.cut_type = CutType.EXCLUSIVE
             self.log = [tau_imlc, non_tau_imlc]
             for imlc in self.log:
                 imlc.find_sublogs_cuts()
 
         def flower_model():
-            new_traces = [[get_tau_activities()], [[a.get_start(), a.get_complete()] for a in self.activities]]
-            tau_imlc = InductiveMinerLifeCycle(new_traces[0], self.root_dfg)
-            exclusive_imlc = InductiveMinerLifeCycle(new_traces[1], self.root_dfg)
+            new_traces = [[get_tau_activities()], [[get_start(a), get_complete(a)] for a in self.activities]]
+            tau_imlc = self.sub_miner(new_traces[0])
+            exclusive_imlc = self.sub_miner(new_traces[1])
             self.cut_type = CutType.LOOP
             self.log = [exclusive_imlc, tau_imlc]
             for imlc in self.log:
                 imlc.find_sublogs_cuts()
 
         def tau_flower():
-            new_traces = [[get_tau_activities()], [[a.get_start(), a.get_complete()] for a in self.activities]]
-            tau_imlc = InductiveMinerLifeCycle(new_traces[0], self.root_dfg)
-            exclusive_imlc = InductiveMinerLifeCycle(new_traces[1], self.root_dfg)
+            new_traces = [[get_tau_activities()], [[get_start(a), get_complete(a)] for a in self.activities]]
+            tau_imlc = self.sub_miner(new_traces[0])
+            exclusive_imlc = self.sub_miner(new_traces[1])
             self.cut_type = CutType.LOOP
             self.log = [tau_imlc, exclusive_imlc]
             for imlc in self.log:
                 imlc.find_sublogs_cuts()
 
         if get_tau_activities() in self.log:
+            instrumentation.record_fall_through("empty_trace")
             empty_trace()
         else:
+            instrumentation.record_fall_through("flower_model")
             flower_model()
 
         # tau_flower()
@@ -872,19 +1476,25 @@ class InductiveMinerLifeCycle:
         base_case = True
         activities = get_collapsed_activities(self.log)
         if not all_equal(activities): base_case = False
-        for trace in self.log:
+        deviating = 0  # traces of a single activity that are not a single execution of it
+        for trace, count in self.log.items():
             if len(trace) <= 2:
                 if len(trace) == 0:
                     pass
-                elif len(trace) == 1 and trace[0].event_type == "s":
+                elif len(trace) == 1 and trace[0] & 3 == START:
                     pass
-                # elif trace[0].label == "τ": base_case = False
-                elif trace[0].label == trace[1].label and trace[0].event_type == "s" and trace[1].event_type == "c":
+                # elif trace[0] >> 2 == TAU: base_case = False
+                elif trace[0] >> 2 == trace[1] >> 2 and trace[0] & 3 == START and trace[1] & 3 == COMPLETE:
                     pass
                 else:
                     base_case = False
             else:
                 base_case = False
+                deviating += count
+        # IMf: repeated executions of a single activity in infrequent traces do not make it a loop
+        if not base_case and len(activities) == 1 and activities[0] != TAU and self.noise_threshold > 0:
+            base_case = deviating < self.noise_threshold * sum(self.log.values()) and \
+                        get_tau_activities() not in self.log
         self.cut_type = CutType.MINIMAL if base_case else CutType.UNKNOWN
 
 
@@ -941,7 +1551,7 @@ if __name__ == "__main__":
     miner = InductiveMinerLifeCycle(traces)
     cuts = miner.find_sublogs_cuts(True)
     print(miner.process_tree)
-    print(miner.ccg)
+    print([miner.alphabet.decode_partitions([edge])[0] for edge in miner.ccg])
     # print()
-    print(miner.dfg)
+    print([tuple(miner.alphabet.decode(a) for a in edge) for edge in miner.dfg])
     # print(miner.ccg)
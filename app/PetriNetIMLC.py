@@ -1,8 +1,18 @@
+import collections
+import itertools
+from typing import Dict, List, Set, Tuple
+
 from app.InduciveMinerLifeCycle import CutType, InductiveMinerLifeCycle
 
+node_ids = itertools.count()  # unlike id(), never reused for another node while the server runs
+REDUCTION_RULES = ["fuse_input_place", "fuse_output_place"]
+
 
 class Place:
+    __slots__ = ("node_id", "name", "tokens", "active")
+
     def __init__(self, name):
+        self.node_id = next(node_ids)
         self.name = name
         self.tokens = 0
         self.active = False
@@ -19,7 +29,10 @@ class Place:
 
 
 class Transition:
+    __slots__ = ("node_id", "label", "name")
+
     def __init__(self, label, name=None):
+        self.node_id = next(node_ids)
         self.label = label  # id
         self.name = name if name else label
 
@@ -28,15 +41,20 @@ class Transition:
 
 
 class Arc:
+    __slots__ = ("source", "target", "hash_value")
+
     def __init__(self, source, target):
         self.source = source
         self.target = target
+        self.hash_value = hash((source, target))
 
     def set_source(self, source):
         self.source = source
+        self.hash_value = hash((self.source, self.target))
 
     def set_target(self, target):
         self.target = target
+        self.hash_value = hash((self.source, self.target))
 
     def __repr__(self):
         return f"{self.source} -> {self.target}"
@@ -45,266 +63,243 @@ class Arc:
         return self.source == other.source and self.target == other.target and type(self) == type(other)
 
     def __hash__(self):
-        return hash((self.source, self.target))
+        return self.hash_value
 
 
 class PetriNetIMLC:
+    """
+    Built from the process tree of a miner in one walk, without sub-nets: an operator adds its places and silent
+    transitions between the places its parent gave it and passes places on to its children, an activity adds its
+    transition. The finished net is reduced once (see reduce), the places are numbered at the end.
+
+    Arcs are indexed per node in both directions (node id -> neighbour node id -> arc), so that adding, removing and
+    redirecting an arc and looking up the preset or postset of a node do not scan the arcs of the net.
+    """
+
     def __init__(self, imlc_miner=None):
         self.initial_place = Place(f"P0"); self.initial_place.active = True
         self.final_place = Place(f"P1")
         self.initial_transition = Transition("T0")
         self.places = [self.initial_place, self.final_place]
-        self.transitions = {self.initial_transition}
-        self.arcs = {Arc(self.initial_place, self.initial_transition), Arc(self.initial_transition, self.final_place)}
+        self.transitions = [self.initial_transition]
+        self.removed: Set[int] = set()  # ids of removed nodes, still in places and transitions until compact
+        self.reductions: Dict[str, int] = dict.fromkeys(REDUCTION_RULES, 0)  # rule -> removed nodes
+        self.incoming_arcs: Dict[int, Dict[int, Arc]] = {}
+        self.outgoing_arcs: Dict[int, Dict[int, Arc]] = {}
+        self.add_arc(self.initial_place, self.initial_transition)
+        self.add_arc(self.initial_transition, self.final_place)
         if imlc_miner: self.create_from_imlc_miner(imlc_miner)
 
     def __repr__(self):
         return f"PetriNet:\n\tPlaces:\n\t\t{self.places}\n\tTransitions:\n\t\t{self.transitions}\n\tArcs:\n\t\t{self.arcs}\n"
 
+    @property
+    def arcs(self) -> List[Arc]:
+        return [arc for arcs in self.outgoing_arcs.values() for arc in arcs.values()]
+
+    def incoming(self, node) -> List[Arc]:
+        return list(self.incoming_arcs.get(node.node_id, {}).values())
+
+    def outgoing(self, node) -> List[Arc]:
+        return list(self.outgoing_arcs.get(node.node_id, {}).values())
+
+    def preset(self, node) -> List:
+        return [arc.source for arc in self.incoming_arcs.get(node.node_id, {}).values()]
+
+    def postset(self, node) -> List:
+        return [arc.target for arc in self.outgoing_arcs.get(node.node_id, {}).values()]
+
+    def insert_arc(self, arc) -> Arc:
+        """Adds the arc unless the net already has an arc between its nodes, returns the arc of the net."""
+        outgoing = self.outgoing_arcs.setdefault(arc.source.node_id, {})
+        if arc.target.node_id in outgoing:
+            return outgoing[arc.target.node_id]
+        outgoing[arc.target.node_id] = arc
+        self.incoming_arcs.setdefault(arc.target.node_id, {})[arc.source.node_id] = arc
+        return arc
+
+    def add_arc(self, source, target) -> Arc:
+        return self.insert_arc(Arc(source, target))
+
+    def remove_arc(self, arc):
+        del self.outgoing_arcs[arc.source.node_id][arc.target.node_id]
+        del self.incoming_arcs[arc.target.node_id][arc.source.node_id]
+
+    def redirect_arc(self, arc, source=None, target=None) -> Arc:
+        """Moves the arc to a new source and/or target, merged into an existing arc between the same nodes."""
+        self.remove_arc(arc)
+        if source is not None:
+            arc.set_source(source)
+        if target is not None:
+            arc.set_target(target)
+        return self.insert_arc(arc)
+
+    def remove_arcs_of(self, node):
+        for arc in self.incoming(node) + self.outgoing(node):
+            self.remove_arc(arc)
+        self.incoming_arcs.pop(node.node_id, None)
+        self.outgoing_arcs.pop(node.node_id, None)
+
+    def remove_transition(self, transition):
+        self.removed.add(transition.node_id)
+        self.remove_arcs_of(transition)
+
+    def remove_place(self, place):
+        self.removed.add(place.node_id)
+        self.remove_arcs_of(place)
+
+    def compact(self):
+        """Drops the removed nodes and numbers the places in order."""
+        self.places = [p for p in self.places if p.node_id not in self.removed]
+        self.transitions = [t for t in self.transitions if t.node_id not in self.removed]
+        self.removed.clear()
+        for i in range(2, len(self.places)):
+            self.places[i].name = f"P{i}"
+
+    def structure_key(self) -> Tuple:
+        """
+        The places, transitions and arcs in the order the DOT writer shows them, with nodes by position. Two refreshes
+        that produce the same model have equal keys (and equal hashes), whatever their node ids.
+        """
+        positions = {node.node_id: i for i, node in enumerate(self.places + self.transitions)}
+        return (tuple((p.name, p.active) for p in self.places),
+                tuple((t.label, t.name) for t in self.transitions),
+                tuple((positions[a.source.node_id], positions[a.target.node_id]) for a in self.arcs))
+
     def add_new_place(self):
         new_place = Place(f"P{len(self.places)}")
         self.places += [new_place]
         return new_place
 
-    def replace_transition(self, transition, petri_net):
-        source_places = [a.source for a in self.arcs if a.target == transition]
-        # print(f"Source places: {source_places}, Arcs: {self.arcs}, Transition: {transition}")
-        target_places = [a.target for a in self.arcs if a.source == transition]
-        sub_start_transitions = [a.target for a in petri_net.arcs if a.source == petri_net.places[0]]
-        sub_end_transitions = [a.source for a in petri_net.arcs if a.target == petri_net.places[1]]
-
-        # Remove (placeholder) transition
-        # print(f"Replacing Transition: {transition} with {petri_net}")
-        self.transitions.remove(transition)
-
-        # Remove arcs that connected to removed transition
-        new_arcs = set()
-        for a in self.arcs:
-            if transition not in [a.source, a.target]:
-                new_arcs.add(a)
-        self.arcs = new_arcs
-
-        # Create Arcs from original PetriNet to new one
-        for p in source_places:
-            for t in sub_start_transitions:
-                self.arcs.add(Arc(p, t))
-
-        # Create Arcs from new PetriNet to original one
-        for t in sub_end_transitions:
-            for p in target_places:
-                self.arcs.add(Arc(t, p))
-
-        # Add Places from new PetriNet, excluding their initial start and final places
-        if len(petri_net.places) > 2:
-            for p in petri_net.places[2:]:
-                self.places += [p]
-
-        # Add Transitions from new PetriNet
-        if len(petri_net.transitions) > 0:
-            for t in petri_net.transitions:
-                self.transitions.add(t)
-
-        # Add Arcs from new PetriNet, excluding arcs from initial start place and to final place
-        if len(petri_net.arcs) > 0:
-            for a in petri_net.arcs:
-                if a.source not in petri_net.places[:2] and a.target not in petri_net.places[:2]:
-                    self.arcs.add(a)
-
-        # Rename places
-        for i in range(2, len(self.places)):
-            self.places[i].name = f"P{i}"
+    def add_new_transition(self, label):
+        new_transition = Transition(label)
+        self.transitions += [new_transition]
+        return new_transition
 
-    def create_from_imlc_miner(self, miner: InductiveMinerLifeCycle):
-        # Create PetriNet with each process_subtree (log entry) being a PetriNet with a single placeholder transition
-        # Build PetriNet based on base cases
+    def label_transition(self, transition, miner: InductiveMinerLifeCycle):
+        transition.label = miner.process_tree
+        if len(miner.activities) == 1:
+            transition.name = miner.alphabet.decode(miner.activities[0]).name
+        elif len(miner.activities) == 0:
+            transition.name = miner.process_tree
+        else:
+            print(f"[-] Minimal Tree has > 1 activities")
 
+    def create_from_imlc_miner(self, miner: InductiveMinerLifeCycle):
         if miner.cut_type == CutType.MINIMAL:
-            self.initial_transition.label = miner.process_tree
-            if len(miner.activities) == 1:
-                self.initial_transition.name = miner.activities[0].name
-            elif len(miner.activities) == 0:
-                self.initial_transition.name = miner.process_tree
-            else:
-                print(f"[-] Minimal Tree has > 1 activities")
+            self.label_transition(self.initial_transition, miner)
             return
 
-        sub_nets = [(Transition(sub_miner.process_tree), PetriNetIMLC(sub_miner)) for sub_miner in miner.log]
-        # [print(Transition(sub_miner.process_tree)) for sub_miner in miner.log]
+        self.remove_transition(self.initial_transition)
+        self.initial_transition = None
+        self.add_subtree(miner, [self.initial_place], [self.final_place])
+        self.reduce()
+        self.compact()
+
+    def add_subtree(self, miner: InductiveMinerLifeCycle, initial_places: List[Place], final_places: List[Place]):
+        """
+        Adds the net of the subtree of the miner, starting with arcs from each initial place and ending with arcs to
+        each final place (two of them in an interleaving).
+        """
+        if miner.cut_type == CutType.MINIMAL:
+            transition = self.add_new_transition("T0")
+            self.label_transition(transition, miner)
+            for p in initial_places:
+                self.add_arc(p, transition)
+            for p in final_places:
+                self.add_arc(transition, p)
+            return
 
-        self.transitions, self.arcs, self.initial_transition = set(), set(), None
+        children = []  # (sub miner, initial places, final places)
 
         if miner.cut_type == CutType.SEQUENCE:
-            # print(f"Applying sequence conversion")
-            for i in range(len(sub_nets)-1):
-                transitions = sub_nets[i][0], sub_nets[i+1][0]
-                place = Place(f"P{len(self.places)}")
-                arc_1 = Arc(transitions[0], place)
-                arc_2 = Arc(place, transitions[1])
-                self.places.append(place)
-                self.arcs.add(arc_1)
-                self.arcs.add(arc_2)
-            self.arcs.add(Arc(self.initial_place, sub_nets[0][0]))
-            self.arcs.add(Arc(sub_nets[-1][0], self.final_place))
-            self.transitions = {t for t, _ in sub_nets}
-            for trans, net in sub_nets:
-                self.replace_transition(trans, net)
+            places = [initial_places] + [[self.add_new_place()] for _ in miner.log[1:]] + [final_places]
+            children = [(sub_miner, places[i], places[i + 1]) for i, sub_miner in enumerate(miner.log)]
 
         elif miner.cut_type == CutType.EXCLUSIVE:
-            # print(f"Applying exclusive conversion")
-            for t, _ in sub_nets:
-                arc_1 = Arc(self.initial_place, t)
-                arc_2 = Arc(t, self.final_place)
-                self.arcs.add(arc_1)
-                self.arcs.add(arc_2)
-                self.transitions.add(t)
-
-            for trans, net in sub_nets:
-                self.replace_transition(trans, net)
-
-        elif miner.cut_type == CutType.PARALLEL:
-            # print(f"Applying parallel conversion")
-            start_transition = Transition("τ")
-            end_transition = Transition("τ")
-            self.transitions.add(start_transition)
-            self.transitions.add(end_transition)
-            self.arcs.add(Arc(self.initial_place, start_transition))
-            self.arcs.add(Arc(end_transition, self.final_place))
-            for t, _ in sub_nets:
-                place_0 = self.add_new_place()
-                place_1 = self.add_new_place()
-                arcs = [
-                    Arc(start_transition, place_0),
-                    Arc(place_0, t),
-                    Arc(t, place_1),
-                    Arc(place_1, end_transition)]
-                [self.arcs.add(arc) for arc in arcs]
-                self.transitions.add(t)
-
-            for trans, net in sub_nets:
-                self.replace_transition(trans, net)
-
-        elif miner.cut_type == CutType.INTERLEAVING:
-            # print(f"Applying parallel conversion")
-            start_transition = Transition("τ")
-            end_transition = Transition("τ")
-            self.transitions.add(start_transition)
-            self.transitions.add(end_transition)
-            self.arcs.add(Arc(self.initial_place, start_transition))
-            self.arcs.add(Arc(end_transition, self.final_place))
-            interleaving_place = self.add_new_place()
-            interleaving_place.active = True
-            for t, _ in sub_nets:
+            children = [(sub_miner, initial_places, final_places) for sub_miner in miner.log]
+
+        elif miner.cut_type in (CutType.PARALLEL, CutType.INTERLEAVING):
+            start_transition = self.add_new_transition("τ")
+            end_transition = self.add_new_transition("τ")
+            for p in initial_places:
+                self.add_arc(p, start_transition)
+            for p in final_places:
+                self.add_arc(end_transition, p)
+            interleaving_places = []
+            if miner.cut_type == CutType.INTERLEAVING:
+                interleaving_place = self.add_new_place()
+                interleaving_place.active = True
+                interleaving_places = [interleaving_place]
+            for sub_miner in miner.log:
                 place_0 = self.add_new_place()
                 place_1 = self.add_new_place()
-                arcs = [
-                    Arc(start_transition, place_0),
-                    Arc(place_0, t),
-                    Arc(t, place_1),
-                    Arc(place_1, end_transition),
-                    Arc(interleaving_place, t),  # Interleaving
-                    Arc(t, interleaving_place)]
-                [self.arcs.add(arc) for arc in arcs]
-                self.transitions.add(t)
-
-            for trans, net in sub_nets:
-                self.replace_transition(trans, net)
+                self.add_arc(start_transition, place_0)
+                self.add_arc(place_1, end_transition)
+                children.append((sub_miner, [place_0] + interleaving_places, [place_1] + interleaving_places))
 
         elif miner.cut_type == CutType.LOOP:  # Start place should not have incoming edges
-            # print(f"Applying loop conversion")
-            t_1 = sub_nets[0][0]
-            t_2 = sub_nets[1][0]
-            st_1 = Transition("τ")
-            st_2 = Transition("τ")
+            st_1 = self.add_new_transition("τ")
+            st_2 = self.add_new_transition("τ")
             p_1 = self.add_new_place()
             p_2 = self.add_new_place()
-            arcs = [
-                Arc(self.initial_place, st_1),
-                Arc(st_1, p_1),
-                Arc(p_1, t_1),
-                Arc(t_1, p_2),
-                Arc(p_2, st_2),
-                Arc(st_2, self.final_place),
-                Arc(p_2, t_2),
-                Arc(t_2, p_1)]
-            [self.arcs.add(arc) for arc in arcs]
-            self.transitions.add(t_1)
-            self.transitions.add(t_2)
-            self.transitions.add(st_1)
-            self.transitions.add(st_2)
-
-            for trans, net in sub_nets:
-                self.replace_transition(trans, net)
-
-        # p0 -> tau -> p1 improvement (one p0, one p1)
-        try:
-            transitions_to_remove = []
-            arcs_to_remove = set()
-            places_to_remove = []
-            for transition in self.transitions:
-                if "τ" in transition.label:
-                    ingoing_places = [a.source for a in self.arcs if a.target == transition]
-                    outgoing_places = [a.target for a in self.arcs if a.source == transition]
-                    if len(ingoing_places) == len(outgoing_places) == 1 and ingoing_places[0] and \
-                            ingoing_places[0] != self.initial_place and outgoing_places[0] != self.final_place:
-                        if len([a for a in self.arcs if ingoing_places[0] == a.source]) == 1:  # remove p0
-                            transitions_to_remove += [transition]
-                            places_to_remove += [ingoing_places[0]]
-                            arcs_to_remove |= set([a for a in self.arcs if transition in [a.source, a.target]])
-                            for a in [a for a in self.arcs if a.target == ingoing_places[0]]:
-                                a.target = outgoing_places[0]
-                            for a in [a for a in self.arcs if a.source == ingoing_places[0]]:
-                                a.source = outgoing_places[0]
-                        elif len([a for a in self.arcs if outgoing_places[0] == a.target]) == 1:  # remove p1
-                            transitions_to_remove += [transition]
-                            places_to_remove += [outgoing_places[0]]
-                            arcs_to_remove |= set([a for a in self.arcs if transition in [a.source, a.target]])
-                            for a in [a for a in self.arcs if a.source == outgoing_places[0]]:
-                                a.source = ingoing_places[0]
-                            for a in [a for a in self.arcs if a.target == outgoing_places[0]]:
-                                a.target = ingoing_places[0]
-            self.arcs = self.arcs - arcs_to_remove
-            [self.transitions.remove(t) for t in transitions_to_remove]
-            [self.places.remove(p) for p in places_to_remove]
-        except Exception as e:
-            print(e)
-
-        # Rename places
-        for i in range(2, len(self.places)):
-            self.places[i].name = f"P{i}"
-
-        # p0 -1> tau -2> p1 -3> tau -4> p2  =>  p0 -1> tau -4> p2
-        try:
-            transitions_to_remove = []
-            arcs_to_remove = set()
-            places_to_remove = []
-            new_arcs = set()
-            for place in self.places[2:]:
-                incoming_transitions = [a.source for a in self.arcs if a.target == place]
-                outgoing_transitions = [a.target for a in self.arcs if a.source == place]
-                original_places = [a.source for a in self.arcs if a.target in incoming_transitions]
-                final_places = [a.target for a in self.arcs if a.source in outgoing_transitions]
-                if self.initial_place in original_places or self.final_place in final_places:
-                    break
-                if all([t.label == "τ" for t in incoming_transitions + outgoing_transitions]) and \
-                        len(incoming_transitions) == len(outgoing_transitions) == 1 and \
-                        len(original_places) == len(final_places) == 1:
-                    for a in self.arcs:
-                        if a.source in incoming_transitions:
-                            for final_place in final_places:
-                                new_arcs |= {Arc(a.source, final_place)}
-                        if place in [a.source, a.target]:
-                            arcs_to_remove |= {a}
-                    places_to_remove += [place]
-
-            self.arcs = (self.arcs | new_arcs) - arcs_to_remove
-            [self.transitions.remove(t) for t in transitions_to_remove]
-            [self.places.remove(p) for p in places_to_remove]
-        except Exception as e:
-            print(e)
-
-        # Rename places
-        for i in range(2, len(self.places)):
-            self.places[i].name = f"P{i}"
+            for p in initial_places:
+                self.add_arc(p, st_1)
+            self.add_arc(st_1, p_1)
+            self.add_arc(p_2, st_2)
+            for p in final_places:
+                self.add_arc(st_2, p)
+            children = [(miner.log[0], [p_1], [p_2]), (miner.log[1], [p_2], [p_1])]
+
+        for sub_miner, sub_initial_places, sub_final_places in children:
+            self.add_subtree(sub_miner, sub_initial_places, sub_final_places)
+
+    def is_silent(self, node) -> bool:
+        return isinstance(node, Transition) and node.label == "τ"
+
+    def reduce(self):
+        """
+        Removes silent transitions with fuse_places until it does not apply anymore. The worklist starts with all
+        silent transitions, after a fusion the silent transitions around the remaining place are checked again.
+        p0 -> tau -> p1 -> tau -> p2 also ends as p0 -> tau -> p2.
+        """
+        worklist = collections.deque(t for t in self.transitions if self.is_silent(t))
+        queued = {t.node_id for t in worklist}
+        while worklist:
+            transition = worklist.popleft()
+            queued.discard(transition.node_id)
+            if transition.node_id in self.removed:
+                continue
+            for t in self.fuse_places(transition):
+                if t.node_id not in queued and self.is_silent(t):
+                    queued.add(t.node_id)
+                    worklist.append(t)
+
+    def fuse_places(self, transition) -> List:
+        """
+        p0 -> tau -> p1 (one p0, one p1) => p1 if tau is the only transition after p0 (fuse_input_place), or p0 if it is
+        the only transition before p1 (fuse_output_place). Returns the transitions around the remaining place.
+        """
+        ingoing_places, outgoing_places = self.preset(transition), self.postset(transition)
+        if len(ingoing_places) != 1 or len(outgoing_places) != 1:
+            return []
+        p0, p1 = ingoing_places[0], outgoing_places[0]
+        if p0 is p1 or p0 is self.initial_place or p1 is self.final_place:
+            return []
+        if self.postset(p0) == [transition] and not set(self.preset(p0)) & set(self.preset(p1)):  # remove p0
+            rule, kept, fused = "fuse_input_place", p1, p0
+            for a in self.incoming(p0):
+                self.redirect_arc(a, target=p1)
+        elif self.preset(p1) == [transition] and not set(self.postset(p1)) & set(self.postset(p0)):  # remove p1
+            rule, kept, fused = "fuse_output_place", p0, p1
+            for a in self.outgoing(p1):
+                self.redirect_arc(a, source=p0)
+        else:
+            return []
+        self.remove_transition(transition)
+        self.remove_place(fused)
+        self.reductions[rule] += 2
+        return self.preset(kept) + self.postset(kept)
 
 
 if __name__ == "__main__":
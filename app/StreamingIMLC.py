@@ -0,0 +1,496 @@
+import functools
+import json
+import time
+from typing import Dict, List, Optional, Set, Tuple
+
+from app.InduciveMinerLifeCycle import Activity, Alphabet, ConcurrencyGraph, CutType, DirectlyFollowsGraph, \
+    DisjointSet, COMPLETE, START, are_concurrent_p, directly_reaches, get_component_reachability, get_start, \
+    get_strongly_connected_components, is_concurrent, default_noise_threshold, filter_ccg, filter_dfg
+from app import instrumentation
+from app.event_store import RUNNING, LocalLogReader, parse_timestamp
+from app.window import InstanceTimeline, Window
+
+EVENT_TYPES = {"calling": "s", "done": "c"}
+
+
+class InstanceState:
+    """
+    Open-interval state of a running instance, bounded by the alphabet instead of the number of events.
+
+    - intervals: from the first start of x until its first completion, the events per activity and which activities
+      were started/completed inside. Later starts of x before that completion only yield a subset of the edges.
+    - scans: completions whose scan for following start events is still open, grouped by the characters of the
+      labels started since. The groups are nested (older groups saw more), equal groups are merged.
+
+    With tallies, the edges the instance added to the DFG and CCG are kept (bounded by the alphabet squared) to evict
+    it again. Without, the CCG edges are only kept while intervals are open: an edge is only added again when an
+    interval closes that was open when it was added first.
+    """
+
+    def __init__(self):
+        self.running: Dict[int, int] = {}  # activity -> started but not yet completed events
+        self.completed: Set[int] = set()
+        self.intervals: Dict[int, Tuple[Dict[int, int], Set[int], Set[int]]] = {}
+        self.scans: List[Tuple[Set[str], Dict[int, int]]] = []  # (characters started since, completions per activity)
+        self.starts: List[int] = []  # activities before the first completion
+        self.ends: List[int] = []  # activities completed after the last start event
+        self.has_completion = False
+        self.edges: Dict[Tuple[int, int], int] = {}  # DFG edge -> frequency added by this instance
+        self.concurrent: Set[Tuple[int, int]] = set()  # CCG edges added by this instance
+
+    def settle(self, tallies: bool) -> tuple:
+        """The state as a tuple, for an instance without running activities (no intervals, nothing running)."""
+        return (tuple((frozenset(characters), tuple(completions.items())) for characters, completions in self.scans),
+                frozenset(self.completed), tuple(self.starts), tuple(self.ends), self.has_completion,
+                tuple(self.edges.items()), frozenset(self.concurrent) if tallies else frozenset())
+
+    @classmethod
+    def resume(cls, settled: tuple) -> "InstanceState":
+        state = cls()
+        scans, completed, starts, ends, state.has_completion, edges, concurrent = settled
+        state.scans = [(set(characters), dict(completions)) for characters, completions in scans]
+        state.completed, state.starts, state.ends = set(completed), list(starts), list(ends)
+        state.edges, state.concurrent = dict(edges), set(concurrent)
+        return state
+
+
+class LifeCycleStream:
+    """
+    DFG, CCG and start/end activity counts of one process model, updated per event without storing traces.
+
+    The relations follow get_dfg_from_expanded_traces and get_ccg_from_expanded_traces on the events seen so far,
+    except for starts that are not completed (yet): the batch miner completes them right after the start, here they
+    are treated as still running. Events are processed in log order.
+
+    With tallies, instances can be evicted again, e.g. when they leave a retention window, which subtracts their
+    edges, and the abstractions of a window are summed from the edges of its instances.
+
+    Only instances with running activities keep an InstanceState. The others are settled into a tuple until their
+    next event, equal tuples (instances that ran the same way so far) are shared.
+    """
+
+    def __init__(self, alphabet: Alphabet, tallies=True):
+        self.alphabet = alphabet
+        self.tallies = tallies
+        self.dfg = DirectlyFollowsGraph()
+        self.ccg = ConcurrencyGraph()  # frequencies: number of instances that added an edge
+        self.instances: Dict[object, InstanceState] = {}  # instances with running activities
+        self.settled: Dict[object, tuple] = {}  # the other instances -> InstanceState.settle()
+        self.settled_states: Dict[tuple, List] = {}  # settled state -> [shared tuple, number of instances]
+        self.timeline = InstanceTimeline()
+
+    def add_event(self, instance, activity: Activity, timestamp: int = 0):
+        state = self.instances.get(instance)
+        if state is None:
+            settled = self.unsettle(instance)
+            state = self.instances[instance] = InstanceState() if settled is None else InstanceState.resume(settled)
+        self.timeline.touch(instance, timestamp)
+        self.add_code(state, self.alphabet.encode(activity))
+        if not state.intervals and not any(state.running.values()):
+            del self.instances[instance]
+            settled = state.settle(self.tallies)
+            shared = self.settled_states.setdefault(settled, [settled, 0])
+            shared[1] += 1
+            self.settled[instance] = shared[0]
+
+    def unsettle(self, instance) -> Optional[tuple]:
+        settled = self.settled.pop(instance, None)
+        if settled is not None:
+            shared = self.settled_states[settled]
+            shared[1] -= 1
+            if not shared[1]:
+                del self.settled_states[settled]
+        return settled
+
+    def get_tallies(self, instance):
+        """DFG edges (with frequencies), CCG edges, start and end activities the instance added."""
+        state = self.instances.get(instance)
+        if state is not None:
+            return state.edges.items(), state.concurrent, state.starts, state.ends
+        _, _, starts, ends, _, edges, concurrent = self.settled[instance]
+        return edges, concurrent, starts, ends
+
+    def add_edge(self, state: InstanceState, a: int, b: int, frequency: int = 1):
+        self.dfg.add_edge(a, b, frequency)
+        if self.tallies:
+            state.edges[(a, b)] = state.edges.get((a, b), 0) + frequency
+
+    def add_concurrency(self, state: InstanceState, a: int, b: int):
+        edge = (min(a, b), max(a, b))
+        if edge not in state.concurrent:
+            state.concurrent.add(edge)
+            self.ccg.add_edge(a, b)
+
+    def evict(self, instance):
+        state = self.instances.get(instance)
+        self.timeline.evict(instance, sum(state.running.values()) if state is not None else 0)
+        if instance not in self.instances and instance not in self.settled:
+            return
+        edges, concurrent, starts, ends = self.get_tallies(instance)
+        self.instances.pop(instance, None)
+        self.unsettle(instance)
+        for (a, b), frequency in edges:
+            self.dfg.remove_edge(a, b, frequency)
+        for a, b in concurrent:
+            self.ccg.remove_edge(a, b, 1)
+        for activities, contributed in [(self.dfg.start_activities, starts), (self.dfg.end_activities, ends)]:
+            for a in contributed:
+                activities[a] -= 1
+                if not activities[a]:
+                    del activities[a]
+
+    def get_window_abstractions(self, instances) -> Tuple[DirectlyFollowsGraph, ConcurrencyGraph]:
+        """DFG and CCG of the given instances only, summed from their edges."""
+        dfg, ccg = DirectlyFollowsGraph(), ConcurrencyGraph()
+        for instance in instances:
+            edges, concurrent, starts, ends = self.get_tallies(instance)
+            for (a, b), frequency in edges:
+                dfg.add_edge(a, b, frequency)
+            for a in starts:
+                dfg.start_activities[a] = dfg.start_activities.get(a, 0) + 1
+            for a in ends:
+                dfg.end_activities[a] = dfg.end_activities.get(a, 0) + 1
+            for a, b in concurrent:
+                ccg.add_edge(a, b)
+        return dfg, ccg
+
+    def add_code(self, state: InstanceState, e: int):
+        event_type, a = e & 3, e & ~3
+        if event_type == COMPLETE and not state.running.get(a):
+            self.add_code(state, get_start(e))  # completion without start is atomic
+
+        for x, (occurrences, started, completed) in list(state.intervals.items()):
+            if x == a and event_type == COMPLETE:
+                del state.intervals[x]
+                self.close_interval(state, x, occurrences, started, completed)
+                continue
+            occurrences[a] = occurrences.get(a, 0) + 1
+            if event_type == START:
+                started.add(a)
+            elif event_type == COMPLETE:
+                completed.add(a)
+
+        label = self.alphabet.labels[a >> 2]
+        if event_type == START:
+            for _, completions in state.scans:
+                for x, n in completions.items():
+                    self.add_edge(state, x, a, n)
+            scans = []
+            for characters, completions in state.scans:
+                characters |= set(label)
+                if scans and scans[-1][0] == characters:
+                    for x, n in completions.items():
+                        scans[-1][1][x] = scans[-1][1].get(x, 0) + n
+                else:
+                    scans.append((characters, completions))
+            state.scans = scans
+            if a not in state.completed and a not in state.intervals:
+                state.intervals[a] = ({}, {a}, set())
+            state.running[a] = state.running.get(a, 0) + 1
+        elif event_type == COMPLETE:
+            while state.scans and label in state.scans[0][0]:  # see get_dfg_from_expanded_traces
+                state.scans.pop(0)
+            if not state.scans or state.scans[-1][0]:
+                state.scans.append((set(), {}))
+            state.scans[-1][1][a] = state.scans[-1][1].get(a, 0) + 1
+            state.running[a] -= 1
+            state.completed.add(a)
+
+        self.update_start_end_activities(state, e)
+
+    def close_interval(self, state: InstanceState, x: int, occurrences: Dict[int, int], started: Set[int],
+                       completed: Set[int]):
+        for y, n in occurrences.items():
+            self.add_edge(state, x, y, n)
+            if y in started and y in completed:
+                self.add_edge(state, y, x, n)
+        # an activity is only concurrent to itself if that is the first concurrency found for it
+        if x in occurrences and x not in self.ccg.neighbours:
+            self.add_concurrency(state, x, x)
+        for y in occurrences:
+            if y != x:
+                self.add_concurrency(state, x, y)
+
+    def update_start_end_activities(self, state: InstanceState, e: int):
+        starts, ends = list(state.starts), list(state.ends)
+        if e & 3 == COMPLETE:
+            state.has_completion = True
+            if e & ~3 not in state.ends and e & ~3 not in state.starts:
+                state.ends.append(e & ~3)
+        else:
+            state.ends = []
+            if not state.has_completion and e & ~3 not in state.starts:
+                state.starts.append(e & ~3)
+        for activities, old, new in [(self.dfg.start_activities, starts, state.starts),
+                                     (self.dfg.end_activities, ends, state.ends)]:
+            for a in old:
+                activities[a] -= 1
+                if not activities[a]:
+                    del activities[a]
+            for a in new:
+                activities[a] = activities.get(a, 0) + 1
+
+
+class LifeCycleStreams(LocalLogReader):
+    """
+    Follows the local log.txt and keeps a LifeCycleStream per process model instead of the events. With a retention
+    window, instances that leave it are evicted while inserting. Only then the streams keep the edges per instance,
+    windows of streams without are mined with get_trace_miner.
+    """
+
+    def __init__(self, local_path="log.txt", retention: Optional[Window] = None):
+        super().__init__(local_path)
+        self.retention = retention
+        self.alphabet = Alphabet()
+        self.processes: Dict[str, LifeCycleStream] = {}
+
+    def clear(self):
+        super().clear()
+        self.alphabet = Alphabet()
+        self.processes = {}
+
+    def insert(self, line: str) -> Optional[str]:
+        try:
+            log_entry = json.loads(line)
+            event_type = EVENT_TYPES.get(log_entry["event"])
+            if event_type is None:
+                return None
+            activity = Activity(log_entry["activity"], event_type, log_entry["label"])
+            stream = self.processes.get(log_entry["instance_name"])
+            if stream is None:
+                stream = self.processes[log_entry["instance_name"]] = LifeCycleStream(self.alphabet,
+                                                                                      self.retention is not None)
+            instance = log_entry["instance"]
+            timestamp = parse_timestamp(log_entry["timestamp"])
+        except Exception as e:
+            print(f"Skipping log entry: {e}")
+            return None
+        if stream.timeline.drops(instance, timestamp, RUNNING[log_entry["event"]]):
+            return None
+        stream.add_event(instance, activity, timestamp)
+        for expired in stream.timeline.expired(self.retention):
+            stream.evict(expired)
+        return log_entry["instance_name"]
+
+    def get_miner(self, process_name, window: Optional[Window] = None,
+                  noise_threshold=None) -> "DirectlyFollowsMiner":
+        """
+        Returns a miner on a copy of the current abstractions (of the window, needs a retention window), later events
+        do not change it.
+        """
+        with self.lock:
+            stream = self.processes.get(process_name)
+            if stream is None:
+                dfg, ccg = DirectlyFollowsGraph(), ConcurrencyGraph()
+            elif window is None:
+                dfg, ccg = stream.dfg, stream.ccg
+            else:
+                dfg, ccg = stream.get_window_abstractions(stream.timeline.select(window))
+            return self.to_miner(dfg, ccg, noise_threshold)
+
+    def get_trace_miner(self, traces: List[Dict[object, List[Activity]]],
+                        noise_threshold=None) -> "DirectlyFollowsMiner":
+        """Returns a miner on the abstractions of the given traces (e.g. of a window), streamed into a new stream."""
+        with self.lock:
+            stream = LifeCycleStream(self.alphabet, False)
+            for trace in traces:
+                for instance, activities in trace.items():
+                    for activity in activities:
+                        stream.add_event(instance, activity)
+            return self.to_miner(stream.dfg, stream.ccg, noise_threshold)
+
+    def to_miner(self, dfg: DirectlyFollowsGraph, ccg: ConcurrencyGraph, noise_threshold) -> "DirectlyFollowsMiner":
+        activities = set(dfg.successors) | set(dfg.predecessors) | set(dfg.start_activities) | set(dfg.end_activities)
+        dfg, ccg = project(dfg, ccg, activities)
+        return DirectlyFollowsMiner(dfg, ccg, self.alphabet, sorted(activities), noise_threshold)
+
+def project(dfg: DirectlyFollowsGraph, ccg: ConcurrencyGraph, part) -> Tuple[DirectlyFollowsGraph, ConcurrencyGraph]:
+    """
+    DFG and CCG restricted to the activities of part. Targets of edges entering part become start activities,
+    sources of edges leaving part end activities.
+    """
+    projected_dfg, projected_ccg = DirectlyFollowsGraph(), ConcurrencyGraph()
+    for a, successors in dfg.successors.items():
+        for b, frequency in successors.items():
+            if a in part and b in part:
+                projected_dfg.add_edge(a, b, frequency)
+            elif b in part:
+                projected_dfg.start_activities[b] = projected_dfg.start_activities.get(b, 0) + frequency
+            elif a in part:
+                projected_dfg.end_activities[a] = projected_dfg.end_activities.get(a, 0) + frequency
+    for activities, original in [(projected_dfg.start_activities, dfg.start_activities),
+                                 (projected_dfg.end_activities, dfg.end_activities)]:
+        for a, count in original.items():
+            if a in part:
+                activities[a] = activities.get(a, 0) + count
+    for (a, b), frequency in ccg.frequencies.items():
+        if a in part and b in part:
+            projected_ccg.add_edge(a, b, frequency)
+    return projected_dfg, projected_ccg
+
+
+class DirectlyFollowsMiner:
+    """
+    Inductive miner on the abstractions of a LifeCycleStream (IMd): cuts are found on the DFG and CCG, the sub-miners
+    get the DFG and CCG projected on their partition instead of sublogs. Without traces, empty traces can not be
+    detected, so there are no τ fall-throughs besides the flower model.
+
+    With a noise threshold, cuts are looked for on the filtered DFG and CCG first (IMfD), the sub-miners get the
+    projection of the filtered ones.
+    """
+
+    def __init__(self, dfg: DirectlyFollowsGraph, ccg: ConcurrencyGraph, alphabet: Alphabet, activities: List[int],
+                 noise_threshold=None):
+        self.dfg = dfg
+        self.ccg = ccg
+        self.alphabet = alphabet
+        self.activities = activities
+        self.noise_threshold = default_noise_threshold if noise_threshold is None else noise_threshold
+        self.log = []
+        self.cut_type = CutType.UNKNOWN
+        self.built_process_tree = False
+        self.debug = False
+        self.depth = 0
+
+    @property
+    def process_tree(self):
+        if self.cut_type == CutType.MINIMAL:
+            return "" + "τ" if not len(self.activities) else str(self.alphabet.decode(self.activities[0])) + ""
+        if not self.built_process_tree: return "[!] No process tree available. Use find_sublog_cuts first."
+        return self.cut_type.value + "(" + ",".join([m.process_tree for m in self.log]) + ")"
+
+    def find_sublogs_cuts(self, debug=False):
+        self.debug = debug
+        instrumentation.record_node(self.depth)
+        if not self.activities or len(self.activities) == 1 and (self.activities[0], self.activities[0]) not in self.dfg:
+            self.cut_type = CutType.MINIMAL
+            self.built_process_tree = True
+            return self.log
+
+        p, cut_type = None, CutType.UNKNOWN
+        if len(self.activities) > 1:
+            if self.noise_threshold > 0:
+                dfg, ccg = self.dfg, self.ccg
+                self.dfg, self.ccg = filter_dfg(dfg, self.noise_threshold), filter_ccg(ccg, self.noise_threshold)
+                p, cut_type = self.find_cut()
+                if cut_type == CutType.UNKNOWN:
+                    self.dfg, self.ccg = dfg, ccg
+                elif self.debug:
+                    print(f"[~] {cut_type.value}{self.alphabet.decode_partitions(p)} - filtered")
+            if cut_type == CutType.UNKNOWN:
+                p, cut_type = self.find_cut()
+        if cut_type == CutType.UNKNOWN:
+            p, cut_type = self.flower_model()  # also ◯(a,τ) for a single activity following itself
+        if self.debug:
+            print(f"[+] {cut_type.value}{self.alphabet.decode_partitions(p)}")
+        self.cut_type = cut_type
+        self.log = [self.sub_miner(part) for part in p]
+        for miner in self.log:
+            miner.find_sublogs_cuts(self.debug)
+        self.built_process_tree = True
+        return self.log
+
+    def find_cut(self):
+        for cut, find_cut in [("sequence", self.find_sequence_cut), ("interleaved", self.find_interleaved_cut),
+                              ("parallel", self.find_parallel_cut), ("exclusive", self.find_exclusive_cut),
+                              ("loop", self.find_loop_cut)]:
+            start = time.perf_counter()
+            p, cut_type = find_cut()
+            instrumentation.record_cut_attempt(cut, time.perf_counter() - start, cut_type != CutType.UNKNOWN)
+            if cut_type != CutType.UNKNOWN:
+                return p, cut_type
+        return None, CutType.UNKNOWN
+
+    def sub_miner(self, part: Set[int]) -> "DirectlyFollowsMiner":
+        dfg, ccg = project(self.dfg, self.ccg, part)
+        miner = DirectlyFollowsMiner(dfg, ccg, self.alphabet, [a for a in self.activities if a in part],
+                                     self.noise_threshold)
+        miner.depth = self.depth + 1
+        return miner
+
+    def has_start_end_activities(self, p) -> bool:
+        return all(part & set(self.dfg.start_activities) and part & set(self.dfg.end_activities) for part in p)
+
+    def find_sequence_cut(self):
+        components = get_strongly_connected_components(self.dfg, self.activities)
+        reachable = get_component_reachability(self.dfg, components)
+        component_of = {a: i for i, component in enumerate(components) for a in component}
+        partitions = DisjointSet(groups=components)
+        for i in range(len(components)):
+            for j in range(i + 1, len(components)):
+                if not reachable[i] >> j & 1 and not reachable[j] >> i & 1:
+                    partitions.union(components[i][0], components[j][0])
+        p = partitions.partitions()
+        if len(p) == 1:
+            return None, CutType.UNKNOWN
+
+        def reachability_sort(pa, pb):
+            pb_components = 0
+            for b in pb:
+                pb_components |= 1 << component_of[b]
+            return -1 if all(reachable[component_of[a]] & pb_components == pb_components for a in pa) else 1
+
+        return sorted(p, key=functools.cmp_to_key(reachability_sort)), CutType.SEQUENCE
+
+    def find_interleaved_cut(self):
+        partitions = DisjointSet(self.activities)
+        for i, a in enumerate(self.activities):
+            for b in self.activities[i + 1:]:
+                if not directly_reaches(a, b, self.dfg) or not directly_reaches(b, a, self.dfg):
+                    partitions.union(a, b)
+        p = partitions.partitions()
+        if len(p) == 1 or not self.has_start_end_activities(p):
+            return None, CutType.UNKNOWN
+        return p, CutType.PARALLEL if are_concurrent_p(self.ccg, p) else CutType.INTERLEAVING
+
+    def find_parallel_cut(self):
+        partitions = DisjointSet(self.activities)
+        for i, a in enumerate(self.activities):
+            for b in self.activities[i + 1:]:
+                if not is_concurrent(a, b, self.ccg):
+                    partitions.union(a, b)
+        p = partitions.partitions()
+        if len(p) == 1 or not self.has_start_end_activities(p):
+            return None, CutType.UNKNOWN
+        return p, CutType.PARALLEL
+
+    def find_exclusive_cut(self):
+        partitions = DisjointSet(self.activities)
+        for a, b in self.dfg:
+            partitions.union(a, b)
+        p = partitions.partitions()
+        if len(p) == 1:
+            return None, CutType.UNKNOWN
+        return p, CutType.EXCLUSIVE
+
+    def find_loop_cut(self):
+        starts, ends = set(self.dfg.start_activities), set(self.dfg.end_activities)
+        do_set = starts | ends
+        partitions = DisjointSet([a for a in self.activities if a not in do_set])
+        for a, b in self.dfg:
+            if a not in do_set and b not in do_set:
+                partitions.union(a, b)
+
+        redo_set = set()
+        for component in partitions.partitions():
+            # a redo component is only entered from all end activities and only left to all start activities
+            sources = {a for b in component for a in self.dfg.predecessors.get(b, ()) if a not in component}
+            targets = {b for a in component for b in self.dfg.successors.get(a, ()) if b not in component}
+            entered = {a for a in ends if any(b in component for b in self.dfg.successors.get(a, ()))}
+            left = {b for b in starts if any(a in component for a in self.dfg.predecessors.get(b, ()))}
+            if sources <= ends and targets <= starts and entered == ends and left == starts:
+                redo_set |= component
+            else:
+                do_set |= component
+        if not redo_set or not do_set:
+            return None, CutType.UNKNOWN
+        return [do_set, redo_set], CutType.LOOP
+
+    def flower_model(self):
+        instrumentation.record_fall_through("flower_model")
+        self.dfg, self.ccg = DirectlyFollowsGraph(), ConcurrencyGraph()
+        for a in self.activities:
+            self.dfg.start_activities[a] = self.dfg.end_activities[a] = 1
+        if self.debug:
+            print(f"[-] Applying fallthrough for: {self.alphabet.decode_partitions([self.activities])} - flower_model")
+        return [set(self.activities), set()], CutType.LOOP
@@ -0,0 +1,118 @@
+import json
+import os
+from typing import Dict, List, Optional
+
+from app.event_store import LocalLogReader
+
+
+class ActivityStore(LocalLogReader):
+    """
+    Instances, timestamps and event types of every activity per process model, as shown for a selected transition
+    (process -> activity -> {"instances", "timestamps", "event_types", "name"}). Keeps every event read since the last
+    reset(), also over truncations of log.txt and restarts: sync() only applies the lines appended since the last call
+    and an event that is already known (same instance and timestamp) is skipped by dict lookups.
+
+    Persisted as a snapshot (activity_data.json, the data itself) and a journal of the events applied since
+    (activity_data.journal, one JSON record per line). The journal is folded into a new snapshot once it has
+    snapshot_every records, replaying it on top of an older snapshot gives the same data.
+    """
+
+    def __init__(self, local_path="log.txt", snapshot_path="activity_data.json",
+                 journal_path="activity_data.journal", snapshot_every=10_000):
+        super().__init__(local_path)
+        self.snapshot_path = snapshot_path
+        self.journal_path = journal_path
+        self.snapshot_every = snapshot_every
+        self.data: Dict[str, Dict[str, Dict]] = {}
+        self.pending: List[List] = []  # [process name, activity, instance, timestamp, event, label] to journal
+        self.journal_records = 0
+        self.json_text: Optional[str] = None  # data as JSON until it changes
+        self.load()
+
+    def load(self):
+        try:
+            with open(self.snapshot_path, "r") as f:
+                self.data = json.load(f)
+        except (OSError, ValueError):  # missing or cleared
+            self.data = {}
+        for activities in self.data.values():
+            for info in activities.values():  # JSON object keys are strings, instances are ints
+                info["timestamps"] = {int(i): timestamps for i, timestamps in info["timestamps"].items()}
+                info["event_types"] = {int(i): event_types for i, event_types in info["event_types"].items()}
+        try:
+            with open(self.journal_path, "r") as f:
+                for line in f:
+                    try:
+                        self.apply(*json.loads(line))
+                    except ValueError:  # last record cut off by a crash
+                        continue
+                    self.journal_records += 1
+        except OSError:
+            pass
+
+    def reset(self):
+        """Drops all events, including the persisted ones."""
+        with self.lock:
+            self.data, self.pending, self.journal_records, self.json_text = {}, [], 0, None
+            for path in (self.snapshot_path, self.journal_path):
+                with open(path, "w") as f:
+                    f.write("")
+
+    def apply(self, process_name, activity, instance, timestamp, event_type, label) -> bool:
+        """Adds an event, returns False if it was known already."""
+        activities = self.data.setdefault(process_name, {})
+        info = activities.get(activity)
+        if info is None:
+            info = activities[activity] = {"instances": [], "timestamps": {}, "event_types": {}, "name": label}
+        event_types = info["event_types"].get(instance)
+        if event_types is None:
+            info["instances"].append(instance)
+            info["timestamps"][instance] = []
+            event_types = info["event_types"][instance] = {}
+        if timestamp not in event_types:
+            info["timestamps"][instance].append(timestamp)
+        elif event_types[timestamp] == event_type:
+            return False
+        event_types[timestamp] = event_type
+        return True
+
+    def insert(self, line: str) -> Optional[str]:
+        try:
+            log_entry = json.loads(line)
+            record = [log_entry["instance_name"], log_entry["activity"], int(log_entry["instance"]),
+                      log_entry["timestamp"], log_entry["event"], log_entry["label"]]
+        except Exception as e:
+            print(f"Skipping log entry: {e}")
+            return None
+        if not self.apply(*record):
+            return None
+        self.pending.append(record)
+        self.json_text = None
+        return log_entry["instance_name"]
+
+    def sync(self):
+        super().sync()
+        with self.lock:
+            if self.journal_records + len(self.pending) >= self.snapshot_every:
+                self.write_snapshot()
+            elif self.pending:
+                with open(self.journal_path, "a") as f:
+                    f.writelines(json.dumps(record) + "\n" for record in self.pending)
+                self.journal_records += len(self.pending)
+            self.pending = []
+
+    def write_snapshot(self):
+        # replaced atomically, a crash before the journal is emptied only replays known events
+        with open(self.snapshot_path + ".tmp", "w") as f:
+            json.dump(self.data, f)
+        os.replace(self.snapshot_path + ".tmp", self.snapshot_path)
+        with open(self.journal_path, "w") as f:
+            f.write("")
+        self.journal_records = 0
+
+    def to_json(self) -> str:
+        """The data as JSON (like jsonify), serialized again only after it changed."""
+        with self.lock:
+            if self.json_text is None:
+                self.json_text = json.dumps(self.data, sort_keys=True, separators=(",", ":"))
+            return self.json_text
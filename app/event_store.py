@@ -0,0 +1,131 @@
+import abc
+import json
+import os
+import threading
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+from app.window import InstanceTimeline, Window
+
+# (timestamp, activity, event, label)
+Event = Tuple[int, str, str, str]
+
+RUNNING = {"calling": 1, "done": -1}  # event -> change of the running activities of an instance
+
+
+def parse_timestamp(timestamp) -> int:
+    try:
+        return int(timestamp)
+    except (TypeError, ValueError):
+        return int(datetime.fromisoformat(timestamp).timestamp() * 1_000_000)
+
+
+class LocalLogReader(abc.ABC):
+    """
+    Follows the local log.txt: sync() only parses the lines appended since the last call and starts over (clear())
+    if the file was truncated. Subclasses index the lines in insert().
+
+    Every process name has a model version: the number of bytes ingested (over all truncations) when its indexed
+    events last changed. A truncation counts as one more byte and changes every version. It only grows, so responses
+    derived from the events can be validated by it.
+    """
+
+    def __init__(self, local_path="log.txt"):
+        self.local_path = local_path
+        self.lock = threading.Lock()
+        self.offset, self.last_line = 0, b""
+        self.ingested = 0
+        self.versions: Dict[str, int] = {}
+
+    def clear(self):
+        if self.offset:  # the indexed events are dropped, every model changes
+            self.ingested += 1
+            self.versions = dict.fromkeys(self.versions, self.ingested)
+        self.offset, self.last_line = 0, b""
+
+    def version(self, process_name) -> int:
+        with self.lock:
+            return self.versions.get(process_name, 0)
+
+    def sync(self):
+        """Indexes the lines appended to the local log since the last sync, starting over if it was truncated."""
+        with self.lock:
+            if not os.path.exists(self.local_path):
+                self.clear()
+                return
+            with open(self.local_path, "rb") as f:
+                f.seek(self.offset - len(self.last_line))
+                data = f.read()
+            if not data.startswith(self.last_line):
+                self.clear()
+                with open(self.local_path, "rb") as f:
+                    data = f.read()
+            else:
+                data = data[len(self.last_line):]
+
+            complete = data[:data.rfind(b"\n") + 1]
+            if not complete:
+                return
+            self.offset += len(complete)
+            self.ingested += len(complete)
+            self.last_line = complete[complete.rfind(b"\n", 0, -1) + 1:]
+            changed = {self.insert(line) for line in complete.decode("utf-8").splitlines() if line.strip()}
+            changed.discard(None)
+            for process_name in changed:
+                self.versions[process_name] = self.ingested
+
+    @abc.abstractmethod
+    def insert(self, line: str) -> Optional[str]:
+        """Indexes a log line, returns the process name whose events changed (None if the line was skipped)."""
+
+
+class EventStore(LocalLogReader):
+    """
+    Index over the local log.txt, partitioned by process model and instance.
+
+    The log file stays the append-only storage; sync() only parses the lines appended since the last call. Events
+    are inserted in timestamp order per instance (ties keep their log order), so reading one process model never
+    touches the events of the others. With a retention window, instances that leave it are evicted while inserting.
+    """
+
+    def __init__(self, local_path="log.txt", retention: Optional[Window] = None):
+        super().__init__(local_path)
+        self.retention = retention
+        self.processes: Dict[str, Dict[object, List[Event]]] = {}
+        self.timelines: Dict[str, InstanceTimeline] = {}
+
+    def clear(self):
+        super().clear()
+        self.processes = {}
+        self.timelines = {}
+
+    def insert(self, line: str) -> Optional[str]:
+        try:
+            log_entry = json.loads(line)
+            event = (parse_timestamp(log_entry["timestamp"]), log_entry["activity"], log_entry["event"],
+                     log_entry["label"])
+            instances = self.processes.setdefault(log_entry["instance_name"], {})
+            timeline = self.timelines.setdefault(log_entry["instance_name"], InstanceTimeline())
+            instance = log_entry["instance"]
+        except Exception as e:
+            print(f"Skipping log entry: {e}")
+            return None
+        if timeline.drops(instance, event[0], RUNNING.get(event[2], 0)):
+            return None
+        events = instances.setdefault(instance, [])
+        i = len(events)
+        while i and events[i - 1][0] > event[0]:  # late events are rare and close to the end, ties keep log order
+            i -= 1
+        events.insert(i, event)
+        timeline.touch(instance, event[0])
+        for expired in timeline.expired(self.retention):
+            timeline.evict(expired, sum(RUNNING.get(event_type, 0) for _, _, event_type, _ in instances.pop(expired)))
+        return log_entry["instance_name"]
+
+    def get_instances(self, process_name, window: Optional[Window] = None) -> List[Tuple[object, List[Event]]]:
+        """Returns (instance, events) of a process model inside the window, sorted by instance."""
+        with self.lock:
+            instances = self.processes.get(process_name, {})
+            timeline = self.timelines.get(process_name, InstanceTimeline())
+            return sorted([(instance, list(instances[instance])) for instance in timeline.select(window)],
+                          key=lambda e: e[0])
@@ -0,0 +1,252 @@
+import bisect
+import contextlib
+import math
+import threading
+import time
+import tracemalloc
+from typing import Dict, List, Optional, Tuple
+
+try:
+    import resource
+except ImportError:  # not available on Windows
+    resource = None
+
+TIME_BUCKETS = (.001, .005, .01, .05, .1, .25, .5, 1, 2.5, 5, 10, 30)
+SIZE_BUCKETS = (1, 10, 100, 1_000, 10_000, 100_000, 1_000_000)
+DEPTH_BUCKETS = (1, 2, 4, 8, 16, 32, 64)
+
+
+def format_labels(labelnames, labels: Tuple) -> str:
+    if not labelnames:
+        return ""
+    return "{" + ",".join(f'{name}="{value}"' for name, value in zip(labelnames, labels)) + "}"
+
+
+class Metric:
+    """A metric family in the Prometheus text format, one sample (series) per combination of label values."""
+    type = None
+
+    def __init__(self, name: str, documentation: str, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.lock = threading.Lock()
+        self.series: Dict[Tuple, object] = {}
+
+    def key(self, labels) -> Tuple:
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.type}"]
+        with self.lock:
+            for labels, value in sorted(self.series.items()):
+                lines += self.render_series(labels, value)
+        return lines
+
+    def render_series(self, labels, value) -> List[str]:
+        return [f"{self.name}{format_labels(self.labelnames, labels)} {value}"]
+
+
+class Counter(Metric):
+    type = "counter"
+
+    def inc(self, amount=1, **labels):
+        key = self.key(labels)
+        with self.lock:
+            self.series[key] = self.series.get(key, 0) + amount
+
+
+class Gauge(Metric):
+    type = "gauge"
+
+    def set(self, value, **labels):
+        with self.lock:
+            self.series[self.key(labels)] = value
+
+
+class Histogram(Metric):
+    type = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames=(), buckets=TIME_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, **labels):
+        key = self.key(labels)
+        with self.lock:
+            series = self.series.get(key)
+            if series is None:
+                series = self.series[key] = [[0] * (len(self.buckets) + 1), 0, 0]  # per bucket, sum, count
+            series[0][bisect.bisect_left(self.buckets, value)] += 1
+            series[1] += value
+            series[2] += 1
+
+    def render_series(self, labels, value) -> List[str]:
+        counts, total, count = value
+        lines, cumulative = [], 0
+        for bound, bucket_count in zip(self.buckets + (math.inf,), counts):
+            cumulative += bucket_count
+            le = "+Inf" if bound == math.inf else repr(bound)
+            lines.append(f'{self.name}_bucket{format_labels(self.labelnames + ("le",), labels + (le,))} {cumulative}')
+        lines.append(f"{self.name}_sum{format_labels(self.labelnames, labels)} {total}")
+        lines.append(f"{self.name}_count{format_labels(self.labelnames, labels)} {count}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self.metrics: List[Metric] = []
+
+    def register(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        return "\n".join(line for metric in self.metrics for line in metric.render()) + "\n"
+
+
+registry = Registry()
+discoveries = registry.register(Counter("imlc_discoveries_total", "Discoveries per mode.", ["mode"]))
+discovery_seconds = registry.register(Histogram("imlc_discovery_seconds", "Wall time of a discovery.", ["mode"]))
+stage_seconds = registry.register(Histogram("imlc_stage_seconds", "Wall time per discovery stage.", ["stage"]))
+cut_attempt_seconds = registry.register(Histogram(
+    "imlc_cut_attempt_seconds", "Wall time per cut attempt on a sublog.", ["cut", "found"]))
+fall_throughs = registry.register(Counter("imlc_fall_throughs_total", "Fall-throughs per kind.", ["kind"]))
+recursion_depth = registry.register(Histogram(
+    "imlc_recursion_depth", "Deepest sublog of a discovery.", buckets=DEPTH_BUCKETS))
+sublog_events = registry.register(Histogram("imlc_sublog_events", "Events per mined sublog.", buckets=SIZE_BUCKETS))
+not_modified = registry.register(Counter(
+    "imlc_not_modified_total", "Requests answered with 304 Not Modified, without discovery.", ["endpoint"]))
+petri_net_reductions = registry.register(Counter(
+    "imlc_petri_net_reductions_total", "Petri net nodes removed per reduction rule.", ["rule"]))
+cache_entries = registry.register(Gauge("imlc_subtree_cache", "Subtree cache hits, misses and size.", ["kind"]))
+dot_cache_entries = registry.register(Gauge("imlc_dot_cache", "DOT cache hits, misses and size.", ["kind"]))
+peak_memory = registry.register(Gauge("process_peak_resident_memory_bytes", "Peak resident memory of the server."))
+
+
+class DiscoveryTrace:
+    """Everything recorded during one discovery, for a single slow refresh. Peak memory is traced with tracemalloc."""
+
+    def __init__(self, mode: str, process_name=None):
+        self.mode = mode
+        self.process_name = process_name
+        self.start = time.perf_counter()
+        self.seconds = None
+        self.stages: List[Dict] = []
+        self.cut_attempts: Dict[Tuple[str, bool], List] = {}  # (cut, found) -> [attempts, seconds]
+        self.nodes = 0
+        self.max_depth = 0
+        self.fall_throughs: Dict[str, int] = {}
+        self.sublog_events: List[int] = []
+        self.reductions: Dict[str, int] = {}
+        self.peak_memory_bytes = None
+
+    def to_dict(self) -> Dict:
+        return {
+            "mode": self.mode,
+            "process_name": self.process_name,
+            "seconds": self.seconds,
+            "stages": self.stages,
+            "cut_attempts": [{"cut": cut, "found": found, "attempts": attempts, "seconds": seconds}
+                             for (cut, found), (attempts, seconds) in self.cut_attempts.items()],
+            "nodes": self.nodes,
+            "max_depth": self.max_depth,
+            "fall_throughs": self.fall_throughs,
+            "sublog_events": self.sublog_events,
+            "reductions": self.reductions,
+            "peak_memory_bytes": self.peak_memory_bytes,
+        }
+
+
+local = threading.local()  # trace of the discovery running in this thread
+last_trace: Optional[DiscoveryTrace] = None
+
+
+def current_trace() -> Optional[DiscoveryTrace]:
+    return getattr(local, "trace", None)
+
+
+@contextlib.contextmanager
+def discovery(mode: str, process_name=None, trace_memory=False):
+    """Records a discovery; the yielded trace collects the stages, cut attempts and sublogs mined in this thread."""
+    global last_trace
+    trace = DiscoveryTrace(mode, process_name)
+    local.trace = trace
+    tracing = trace_memory and not tracemalloc.is_tracing()
+    if tracing:
+        tracemalloc.start()
+    try:
+        yield trace
+    finally:
+        if tracing:
+            trace.peak_memory_bytes = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+        local.trace = None
+        trace.seconds = time.perf_counter() - trace.start
+        discoveries.inc(mode=mode)
+        discovery_seconds.observe(trace.seconds, mode=mode)
+        recursion_depth.observe(trace.max_depth)
+        last_trace = trace
+
+
+@contextlib.contextmanager
+def stage(name: str):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        seconds = time.perf_counter() - start
+        stage_seconds.observe(seconds, stage=name)
+        trace = current_trace()
+        if trace is not None:
+            trace.stages.append({"stage": name, "start": start - trace.start, "seconds": seconds})
+
+
+def record_node(depth: int):
+    """A sublog mined at the given recursion depth (0 is the whole log)."""
+    trace = current_trace()
+    if trace is not None:
+        trace.nodes += 1
+        trace.max_depth = max(trace.max_depth, depth)
+
+
+def record_cut_attempt(cut: str, seconds: float, found: bool):
+    cut_attempt_seconds.observe(seconds, cut=cut, found=str(found).lower())
+    trace = current_trace()
+    if trace is not None:
+        attempt = trace.cut_attempts.setdefault((cut, found), [0, 0.0])
+        attempt[0] += 1
+        attempt[1] += seconds
+
+
+def record_fall_through(kind: str):
+    fall_throughs.inc(kind=kind)
+    trace = current_trace()
+    if trace is not None:
+        trace.fall_throughs[kind] = trace.fall_throughs.get(kind, 0) + 1
+
+
+def record_sublogs(sizes: List[int]):
+    trace = current_trace()
+    for size in sizes:
+        sublog_events.observe(size)
+        if trace is not None:
+            trace.sublog_events.append(size)
+
+
+def record_reductions(reductions: Dict[str, int]):
+    """Nodes removed per rule by the reduction of a Petri net."""
+    for rule, removed in reductions.items():
+        petri_net_reductions.inc(removed, rule=rule)
+    trace = current_trace()
+    if trace is not None:
+        trace.reductions = dict(reductions)
+
+
+def render_metrics(cache_stats: Dict[str, int], dot_cache_stats: Dict[str, int]) -> str:
+    for kind in ("hits", "misses", "size"):
+        cache_entries.set(cache_stats[kind], kind=kind)
+        dot_cache_entries.set(dot_cache_stats[kind], kind=kind)
+    if resource is not None:
+        peak_memory.set(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024)  # kilobytes on Linux
+    return registry.render()
@@ -0,0 +1,88 @@
+import queue
+import threading
+import time
+
+from app.log_tail import RemoteLogTail
+
+
+class Subscriber:
+    """Bounded queue of line-count deltas for a single /events connection."""
+
+    def __init__(self, maxsize=16):
+        self.queue = queue.Queue(maxsize)
+
+    def put(self, delta: int):
+        # Only the ingestion thread puts, so after draining a full queue there is room for the coalesced delta
+        try:
+            self.queue.put_nowait(delta)
+        except queue.Full:
+            while True:
+                try:
+                    delta += self.queue.get_nowait()
+                except queue.Empty:
+                    break
+            self.queue.put_nowait(delta)
+
+    def get(self, timeout=None) -> int:
+        return self.queue.get(timeout=timeout)
+
+
+class LogBroker:
+    """
+    Single background loop polling the remote log, publishing the number of new lines to all subscribers.
+
+    The loop is started with the first subscriber, so importing the app does not start polling the server, and idles
+    while there are no subscribers. While it polls, requests do not fetch the remote log themselves (polling()).
+    """
+
+    def __init__(self, log_tail: RemoteLogTail, interval=.1, queue_size=16):
+        self.log_tail = log_tail
+        self.interval = interval
+        self.queue_size = queue_size
+        self.subscribers = set()
+        self.lock = threading.Lock()
+        self.thread = None
+        self.active = threading.Event()  # set while there are subscribers
+        self.last_lines = 0
+
+    def subscribe(self) -> Subscriber:
+        subscriber = Subscriber(self.queue_size)
+        with self.lock:
+            if self.last_lines:
+                subscriber.put(self.last_lines)  # a new subscriber first receives the current log size
+            self.subscribers.add(subscriber)
+            self.active.set()
+            if self.thread is None:
+                self.thread = threading.Thread(target=self.run, daemon=True)
+                self.thread.start()
+        return subscriber
+
+    def unsubscribe(self, subscriber: Subscriber):
+        with self.lock:
+            self.subscribers.discard(subscriber)
+            if not self.subscribers:
+                self.active.clear()
+
+    def polling(self) -> bool:
+        """Whether the loop keeps the local log current, so a request does not need to fetch it."""
+        return self.active.is_set()
+
+    def publish(self, delta: int):
+        with self.lock:
+            self.last_lines += delta
+            for subscriber in self.subscribers:
+                subscriber.put(delta)
+
+    def run(self):
+        while True:
+            self.active.wait()
+            try:
+                self.log_tail.fetch()
+                # Other requests fetch from the same tail, so compare line counts instead of the returned lines
+                current_lines = self.log_tail.line_count
+                if current_lines != self.last_lines:
+                    self.publish(current_lines - self.last_lines)
+            except Exception as e:
+                print(f"Error fetching remote file: {e}")
+
+            time.sleep(self.interval)  # Timeout because of lehre.bpm.in.tum.de limit: "Max retries exceeded [...]"
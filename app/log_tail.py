@@ -0,0 +1,118 @@
+import os
+import re
+import threading
+from typing import List
+
+import requests as requests
+
+LOG_URL = "https://lehre.bpm.in.tum.de/~ge93yoh/pd/log.txt"
+
+
+class RemoteLogTail:
+    """
+    Mirrors the remote log.txt into a local file by only requesting the bytes after a cursor.
+
+    The local file only ever holds complete lines, so its size doubles as the persistent byte cursor: after a
+    restart the tail resumes where the previous process stopped. Every request re-reads the last mirrored line - if
+    it changed (or the remote log is shorter than the cursor), the remote log was truncated, e.g. by clear_log.php,
+    and the whole file is fetched again.
+    """
+
+    def __init__(self, url=LOG_URL, local_path="log.txt", session=None):
+        self.url = url
+        self.local_path = local_path
+        self.session = session if session else requests.Session()
+        self.lock = threading.Lock()
+        self.etag = None
+        self.last_modified = None
+        self.truncated = False  # whether the latest fetch had to start over
+        self.offset, self.line_count, self.last_line = 0, 0, b""
+        if os.path.exists(local_path):
+            with open(local_path, "rb") as f:
+                content = f.read()
+            # drop an incomplete last line, it will be requested again
+            content = content[:content.rfind(b"\n") + 1]
+            self.offset, self.line_count = len(content), content.count(b"\n")
+            self.last_line = content[content.rfind(b"\n", 0, -1) + 1:]
+
+    def reset(self):
+        with self.lock:
+            self.etag, self.last_modified = None, None
+            self.offset, self.line_count, self.last_line = 0, 0, b""
+            with open(self.local_path, "w") as f:
+                f.write("")
+
+    def fetch(self) -> List[str]:
+        """Requests new bytes of the remote log, appends complete lines to the local file and returns them."""
+        with self.lock:
+            self.truncated = False
+            start = self.offset - len(self.last_line)
+            headers = {}
+            if start > 0:
+                headers["Range"] = f"bytes={start}-"
+            if self.etag:
+                headers["If-None-Match"] = self.etag
+            if self.last_modified:
+                headers["If-Modified-Since"] = self.last_modified
+            response = self.session.get(self.url, headers=headers)
+
+            if response.status_code == 304:
+                return []
+            if response.status_code == 416:  # remote log is shorter than the cursor
+                return self.full_fetch()
+            if response.status_code == 206:
+                content_range = re.match(r"bytes (\d+)-", response.headers.get("Content-Range", ""))
+                if not content_range or int(content_range.group(1)) != start:
+                    return self.full_fetch()
+                data = response.content
+            elif response.status_code == 200:  # Range not supported, slice the full log locally
+                return self.continue_full(response)
+            else:
+                print("Failed to retrieve the log file:", response.status_code)
+                return []
+
+            if not data.startswith(self.last_line):
+                return self.full_fetch()
+            self.remember_validators(response)
+            return self.append(data[len(self.last_line):])
+
+    def full_fetch(self) -> List[str]:
+        response = self.session.get(self.url)
+        if response.status_code != 200:
+            print("Failed to retrieve the log file:", response.status_code)
+            return []
+        return self.continue_full(response)
+
+    def continue_full(self, response) -> List[str]:
+        """Appends what follows the cursor in the full log, or starts over if the last mirrored line changed."""
+        if response.content[self.offset - len(self.last_line):self.offset] != self.last_line:
+            return self.restart(response)
+        self.remember_validators(response)
+        return self.append(response.content[self.offset:])
+
+    def restart(self, response) -> List[str]:
+        self.truncated = True
+        self.offset, self.line_count, self.last_line = 0, 0, b""
+        with open(self.local_path, "w") as f:
+            f.write("")
+        self.remember_validators(response)
+        return self.append(response.content)
+
+    def remember_validators(self, response):
+        self.etag = response.headers.get("ETag")
+        self.last_modified = response.headers.get("Last-Modified")
+
+    def append(self, data: bytes) -> List[str]:
+        complete = data[:data.rfind(b"\n") + 1]
+        if len(complete) < len(data):
+            # the incomplete last line has to be requested again, so the validators must not match yet
+            self.etag, self.last_modified = None, None
+        if not complete:
+            return []
+        with open(self.local_path, "ab") as f:
+            f.write(complete)
+        self.offset += len(complete)
+        self.last_line = complete[complete.rfind(b"\n", 0, -1) + 1:]
+        lines = complete.decode("utf-8").splitlines()
+        self.line_count += len(lines)
+        return lines
@@ -1,5 +1,6 @@
-import itertools
+import hashlib
 import json
+import queue
 import re
 import subprocess
 import time
@@ -7,65 +8,146 @@ from typing import List, Dict
 
 import requests as requests
 
-from app.InduciveMinerLifeCycle import Activity, InductiveMinerLifeCycle
+from app import instrumentation
+from app.InduciveMinerLifeCycle import Activity, InductiveMinerLifeCycle, SubtreeCache, subtree_cache
 from app.PetriNetIMLC import PetriNetIMLC
+from app.StreamingIMLC import LifeCycleStreams
+from app.activity_store import ActivityStore
+from app.event_store import EventStore
+from app.log_broker import LogBroker
+from app.log_tail import RemoteLogTail
+from app.window import Window
+
+log_tail = RemoteLogTail()
+log_broker = LogBroker(log_tail)
+event_store = EventStore(retention=Window.from_env())
+life_cycle_streams = LifeCycleStreams(retention=Window.from_env())
+activity_store = ActivityStore()
+dot_cache = SubtreeCache(maxsize=64)  # the same bounded LRU, net structure -> DOT
+server_run = f"{time.time_ns():x}"  # model versions start over with the server, their ETags must not match
+
+
+def get_dot_text(text) -> str:
+    """Label text as shown: source/sink as s0/sf, p_1 as p1, None as tau."""
+    text = str(text).replace("source", "s0").replace("sink", "sf")
+    return re.sub(r'p_(\d+)', r'p\1', text).replace("None", "tau")
+
+
+def get_dot_node_ids(petri_net) -> Dict[int, str]:
+    """
+    Node id -> DOT node ID from the content of the net, the same for the same model on every refresh: the place name,
+    or the transition label, numbered from the second transition with the same label on (τ).
+    """
+    node_ids, labels = {p.node_id: p.name for p in petri_net.places}, {}
+    for t in petri_net.transitions:
+        label = get_dot_text(t.label).replace("\\", "\\\\").replace('"', '\\"')
+        labels[label] = labels.get(label, 0) + 1
+        node_ids[t.node_id] = f"t:{label}" if labels[label] == 1 else f"t:{label}:{labels[label]}"
+    return node_ids
+
+
+def write_dot(petri_net) -> str:
+    penwidth = 1
+    node_ids = get_dot_node_ids(petri_net)
+    lines = ["digraph G {",
+             "\trankdir=LR;",
+             "\tcenter=true; margin=1;",
+             "\tsubgraph place {",
+             '\t\tnode [shape=circle,fixedsize=true,label="", height=.4,width=.4, fontsize="12pt"];']
+    for p in petri_net.places:
+        if p.name == "P0" or (p.active and p.name != "P1"):
+            width = penwidth + 2
+        elif p.name == "P1":
+            width = penwidth + 1
+        else:
+            width = penwidth
+        lines.append(f'\t\t"{node_ids[p.node_id]}" [label=<<B>{p.name[0]}<SUB>{p.name[1:]}</SUB></B>>, class="place", '
+                     f'penwidth={width}];')
+    lines += ["\t}",
+              "\tsubgraph transitions {",
+              '\t\tnode [shape=rect,fixedsize=true,height=.6,width=.4, fontsize="12pt"];']
+    for t in petri_net.transitions:
+        if t.name != "τ":
+            lines.append(f'\t\t"{node_ids[t.node_id]}" [label=<<B>{get_dot_text(t.label)}</B>>, '
+                         f'name="{get_dot_text(t.name)}", class="transition", penwidth={penwidth}];')
+        else:
+            lines.append(f'\t\t"{node_ids[t.node_id]}" [label="", name="", class="transition", width=0.01, '
+                         f'penwidth={penwidth}];')
+    lines.append("\t}")
+    for a in petri_net.arcs:
+        lines.append(f'\t"{node_ids[a.source.node_id]}"->"{node_ids[a.target.node_id]}" [penwidth={penwidth}];')
+    lines.append("}")
+    return "\n".join(lines)
 
 
 def get_digraph_from_custom_petri_net(petri_net):
-    penwidth = 1
-    places = "\n".join([
-        f'\t\t"{id(p)}" [label=<<B>{p.name[0] + "<SUB>" + p.name[1:] + "</SUB>"}</B>>, class="place", penwidth={penwidth+2}];'
-        if p.name == "P0" else \
-        f'\t\t"{id(p)}" [label=<<B>{p.name[0] + "<SUB>" + p.name[1:] + "</SUB>"}</B>>, class="place", penwidth={penwidth+1}];'
-        if p.name == "P1" else \
-        f'\t\t"{id(p)}" [label=<<B>{p.name[0] + "<SUB>" + p.name[1:] + "</SUB>"}</B>>, class="place", penwidth={penwidth+2}];'
-        if p.active else \
-        f'\t\t"{id(p)}" [label=<<B>{p.name[0] + "<SUB>" + p.name[1:] + "</SUB>"}</B>>, class="place", penwidth={penwidth}];'
-        for p in petri_net.places])
-    transitions = "\n".join([
-        f'\t\t"{id(t)}" [label=<<B>{t.label}</B>>, name="{t.name}", class="transition", penwidth={penwidth}];' if \
-            t.name != "τ" else \
-            f'\t\t"{id(t)}" [label="", name="", class="transition", width=0.01, penwidth={penwidth}];'
-        for t in petri_net.transitions])
-    arcs = "\n".join([f'\t"{id(a.source)}"->"{id(a.target)}" [penwidth={penwidth}];' for a in petri_net.arcs])
-
-    digraph = """digraph G {
-\trankdir=LR;
-\tcenter=true; margin=1;
-\tsubgraph place {
-\t\tnode [shape=circle,fixedsize=true,label="", height=.4,width=.4, fontsize="12pt"];
-""" + places + """
-\t}
-\tsubgraph transitions {
-\t\tnode [shape=rect,fixedsize=true,height=.6,width=.4, fontsize="12pt"];
-""" + transitions + """
-\t}
-""" + arcs + """
-}"""
-    digraph = digraph.replace("source", "s0").replace("sink", "sf")
-    digraph = re.sub(r'p_(\d+)', r'p\1', digraph)
-    digraph = re.sub(r'None', r'tau', digraph)
-
-    # print(digraph)
+    """The DOT of the net, taken from dot_cache if a previous refresh produced the same net."""
+    key = petri_net.structure_key()
+    digraph = dot_cache.get(key)
+    if digraph is None:
+        digraph = write_dot(petri_net)
+        dot_cache.put(key, digraph)
     return digraph
 
 
-def get_digraph_from_json_log(process_name):
-    traces = get_traces_from_log(process_name)
-    traces = [list(trace.values())[0] for trace in traces]
-    # print(traces)
-    miner = InductiveMinerLifeCycle(traces)
-    # print(miner.log)
-    miner.find_sublogs_cuts(True)  # Set True to see when which cut was made
-    print(f"Process Tree: {miner.process_tree}")
-    petri_net = PetriNetIMLC(miner)
-    # print(petri_net)
-    digraph = get_digraph_from_custom_petri_net(petri_net)
+def get_digraph_from_json_log(process_name, streaming=False, window=None, noise_threshold=None, trace=False):
+    """Returns the digraph, and the instrumentation trace of the discovery as a dict if trace is set."""
+    with instrumentation.discovery("streaming" if streaming else "batch", process_name, trace) as discovery:
+        with instrumentation.stage("load"):
+            if streaming:
+                # only the DFG/CCG of the process are kept, see StreamingIMLC
+                life_cycle_streams.sync()
+                if window is None or life_cycle_streams.retention is not None:
+                    miner = life_cycle_streams.get_miner(process_name, window, noise_threshold)
+                else:  # the streams keep no edges per instance, the window is streamed again from the events
+                    miner = life_cycle_streams.get_trace_miner(get_traces_from_log(process_name, window),
+                                                               noise_threshold)
+            else:
+                traces = get_traces_from_log(process_name, window)
+                traces = [list(trace.values())[0] for trace in traces]
+                # print(traces)
+                miner = InductiveMinerLifeCycle(traces, noise_threshold=noise_threshold)
+        # print(miner.log)
+        with instrumentation.stage("mining"):
+            miner.find_sublogs_cuts(False)  # Set True to see when which cut was made
+        with instrumentation.stage("petri_net"):
+            petri_net = PetriNetIMLC(miner)
+        instrumentation.record_reductions(petri_net.reductions)
+        # print(petri_net)
+        with instrumentation.stage("dot"):
+            digraph = get_digraph_from_custom_petri_net(petri_net)
+    if trace:
+        return digraph, discovery.to_dict()
     return digraph
 
 
-def get_traces_from_json_log(process_name):
-    traces = get_traces_from_log(process_name)
+def get_model_version(process_name, streaming=False) -> int:
+    """Version of the events the model of the process name is discovered from, after syncing the local log."""
+    reader = life_cycle_streams if streaming else event_store
+    reader.sync()
+    return reader.version(process_name)
+
+
+def get_etag(endpoint, data, version) -> str:
+    """Strong ETag of a response: the model version and the request parameters it was computed from."""
+    parameters = json.dumps([endpoint, data], sort_keys=True)
+    return f"{server_run}-{version}-{hashlib.sha1(parameters.encode()).hexdigest()[:16]}"
+
+
+def record_not_modified(endpoint):
+    instrumentation.not_modified.inc(endpoint=endpoint)
+
+
+def get_metrics():
+    return instrumentation.render_metrics(subtree_cache.stats(), dot_cache.stats())
+
+
+def get_last_trace():
+    return instrumentation.last_trace.to_dict() if instrumentation.last_trace else {}
+
+
+def get_traces_from_json_log(process_name, window=None):
+    traces = get_traces_from_log(process_name, window)
     traces_string = "\n".join(
         [f"{list(trace.keys())[0]}: {';'.join([a.html_name_str() for a in list(trace.values())[0]])}" for trace in
          traces])
@@ -73,110 +155,26 @@ def get_traces_from_json_log(process_name):
     return traces_string
 
 
-def get_traces_from_log(process_name) -> List[Dict[str, List[Activity]]]:
-    logs = []
-    with open("log.txt", 'r') as file:
-        for line in file:
-            log_entry = json.loads(line.strip())
-            if log_entry["instance_name"] == process_name:
-                logs.append(log_entry)
-
-    try:
-        logs = sorted(logs, key=lambda e: e["instance"])  # sort by instance
-        logs = itertools.groupby(logs, lambda e: e["instance"])
-    except Exception as e:
-        print(e)
-    try:
-        logs = {key: sorted(list(value), key=lambda e: e["timestamp"]) for key, value in logs}
-    except Exception as e:
-        print(e)
-    # print(logs)
+def get_traces_from_log(process_name, window=None) -> List[Dict[str, List[Activity]]]:
+    event_store.sync()
 
     traces = []
-    for instance, log_entries in logs.items():
+    for instance, events in event_store.get_instances(process_name, window):
         trace = {instance: []}
-        for log_entry in log_entries:
-            if log_entry["event"] == "calling":
-                trace[instance] += [Activity(log_entry["activity"], "s", log_entry["label"])]
-            if log_entry["event"] == "done":
-                trace[instance] += [Activity(log_entry["activity"], "c", log_entry["label"])]
+        for _, activity, event_type, label in events:
+            if event_type == "calling":
+                trace[instance] += [Activity(activity, "s", label)]
+            if event_type == "done":
+                trace[instance] += [Activity(activity, "c", label)]
         traces += [trace]
 
     return traces
 
 
-def convert_keys_to_int(data):
-    if isinstance(data, dict):
-        for key, value in list(data.items()):
-            if (not isinstance(key, int)) and re.compile(r"^\d+$").match(key):
-                data[int(key)] = value
-                del data[key]
-            convert_keys_to_int(value)
-    elif isinstance(data, list):
-        for item in data:
-            convert_keys_to_int(item)
-
-
-# log.txt -> activity_data.json
-def update_activity_data():
-    log_path = "log.txt"
-    json_path = "activity_data.json"
-    # log_path = "../log.txt"
-    # json_path = "../activity_data.json"
-    with open(log_path, "r") as f:
-        lines = [json.loads(line) for line in f.readlines()]
-
-    try:
-        with open(json_path, "r") as json_file:
-            data = json.load(json_file)
-    except Exception as e:
-        data = {}
-
-    convert_keys_to_int(data)
-
-    for log_entry in lines:
-        process_name = log_entry["instance_name"]
-        instance = int(log_entry["instance"])
-        timestamp = log_entry["timestamp"]
-        activity = log_entry["activity"]
-        event_type = log_entry["event"]
-        if process_name not in data.keys():
-            data[process_name] = {
-                activity: {
-                    "instances": [instance],
-                    "timestamps": {instance: [timestamp]},
-                    "event_types": {instance: {timestamp: event_type}},
-                    "name": log_entry["label"]
-                }
-            }
-        else:
-            process = data[process_name]
-            if activity not in process.keys():
-                process[activity] = {
-                    "instances": [instance],
-                    "timestamps": {instance: [timestamp]},
-                    "event_types": {instance: {timestamp: event_type}},
-                    "name": log_entry["label"]
-                }
-            else:
-                logged_instances = process[activity]["instances"]
-                if instance in logged_instances:
-                    process[activity]["instances"] = logged_instances
-                    process[activity]["timestamps"][instance] += [
-                        timestamp] if timestamp not in process[activity]["timestamps"][instance] else []
-                    process[activity]["event_types"][instance][timestamp] = event_type
-
-                else:
-                    process[activity]["instances"] = logged_instances + [instance]
-                    process[activity]["timestamps"][instance] = [timestamp]
-                    process[activity]["event_types"][instance] = {timestamp: event_type}
-
-    convert_keys_to_int(data)
-
-    with open(json_path, "w") as f:
-        json.dump(data, f)
-
-    return data
+# log.txt -> activity_data as JSON
+def update_activity_data() -> str:
+    activity_store.sync()
+    return activity_store.to_json()
 
 
 def start_process_instances(process_name, amount):
@@ -185,57 +183,34 @@ def start_process_instances(process_name, amount):
                         'behavior=fork_running', '-F', f'xml=@"processes/{process_name}.xml"'])
 
 
+# Appends new lines of the remote log to log.txt and returns them, unless the polling loop of /events does it anyway
 def get_log_txt_from_server():
-    url = "https://lehre.bpm.in.tum.de/~ge93yoh/pd/log.txt"
-    response = requests.get(url)
-    if response.status_code == 200:
-        log_text = response.text
-        with open("log.txt", "w") as f:
-            f.write(log_text)
-        return log_text
-    else:
-        print("Failed to retrieve the log file:", response.status_code)
-        return "DO NOT UPDATE"
+    if log_broker.polling():
+        return []
+    return log_tail.fetch()
 
 
 def clear_log_txt():
     url = "https://lehre.bpm.in.tum.de/~ge93yoh/pd/clear_log.php"
     requests.get(url)
-    with open("log.txt", "w") as f:
-        f.write("")
+    log_tail.reset()
 
 
 def clear_activity_data_json():
-    with open("activity_data.json", "w") as f:
-        f.write("")
-
-
-def count_lines(text):
-    if text is None: return 0
-    return text.count('\n') + 1
+    activity_store.reset()
 
 
 def monitor_remote_file():
-    last_content = None
-
-    while True:
-        try:
-            current_content = get_log_txt_from_server()
-            current_lines = count_lines(current_content)
-            last_lines = count_lines(last_content)
-
-            if current_lines != last_lines:
-                yield f"data: {current_lines - last_lines}\n\n"
-                last_content = current_content
-
-        except Exception as e:
-            print(f"Error fetching remote file: {e}")
-
-        time.sleep(.1)  # Timeout because of lehre.bpm.in.tum.de limit: "Max retries exceeded with url: log.txt [...]"
-        # Error fetching remote file: HTTPSConnectionPool(host='lehre.bpm.in.tum.de', port=443): Max retries exceeded
-        # with url: /~ge93yoh/pd/log.txt (Caused by NewConnectionError('<urllib3.connection.HTTPSConnection object at
-        # 0x0000023D9D244490>: Failed to establish a new connection: [WinError 10048] Only one usage of each socket
-        # address (protocol/network address/port) is normally permitted'))
+    # All connections share the single polling loop of log_broker and only read their own queue
+    subscriber = log_broker.subscribe()
+    try:
+        while True:
+            try:
+                yield f"data: {subscriber.get(timeout=15)}\n\n"
+            except queue.Empty:
+                yield ": keep-alive\n\n"  # lets Flask notice closed connections
+    finally:
+        log_broker.unsubscribe(subscriber)
 
 
 if __name__ == "__main__":
@@ -1,5 +1,6 @@
 from flask import request, jsonify, render_template, Response
 from app.miner import *
+from app.window import Window
 
 from app import app
 
@@ -9,18 +10,50 @@ def home_route():
     return render_template('index.html')
 
 
+def not_modified(endpoint, etag):
+    # the client has the response of the current model version, nothing is discovered or rendered
+    record_not_modified(endpoint)
+    response = Response(status=304)
+    response.set_etag(etag)
+    return response
+
+
 @app.route("/digraph", methods=["POST"])
 def get_digraph_endpoint():
     try:
         get_log_txt_from_server()
         data = request.json
         process_name = data["process_name"]
-        digraph = get_digraph_from_json_log(process_name)
-        return jsonify(message=digraph)
+        etag = get_etag("digraph", data, get_model_version(process_name, data.get("streaming", False)))
+        if data.get("trace", False):
+            # the instrumentation trace of this discovery, stages, cut attempts, sublogs and peak memory (never 304)
+            digraph, trace = get_digraph_from_json_log(process_name, data.get("streaming", False),
+                                                       Window.from_request(data), data.get("noise_threshold"), True)
+            response = jsonify(message=digraph, trace=trace)
+        elif request.if_none_match.contains(etag):
+            return not_modified("digraph", etag)
+        else:
+            digraph = get_digraph_from_json_log(process_name, data.get("streaming", False), Window.from_request(data),
+                                                data.get("noise_threshold"))
+            response = jsonify(message=digraph)
+        response.set_etag(etag)
+        return response
     except Exception as e:
         return jsonify(error=str(e)), 500
 
 
+# Discovery counters and histograms in the Prometheus text format
+@app.route("/metrics", methods=["GET"])
+def get_metrics_endpoint():
+    return Response(get_metrics(), content_type="text/plain; version=0.0.4")
+
+
+# Instrumentation trace of the latest discovery
+@app.route("/metrics/trace", methods=["GET"])
+def get_last_trace_endpoint():
+    return jsonify(get_last_trace())
+
+
 # Retrieve the current traces
 @app.route("/traces", methods=["POST"])
 def get_traces_endpoint():
@@ -28,20 +61,24 @@ def get_traces_endpoint():
         # traces = get_traces().replace("ε", "&#949;")
         data = request.json
         process_name = data["process_name"]
-        traces = get_traces_from_json_log(process_name)
-        return jsonify(message=traces)
+        etag = get_etag("traces", data, get_model_version(process_name))
+        if request.if_none_match.contains(etag):
+            return not_modified("traces", etag)
+        traces = get_traces_from_json_log(process_name, Window.from_request(data))
+        response = jsonify(message=traces)
+        response.set_etag(etag)
+        return response
     except Exception as e:
         return jsonify(error=str(e)), 500
 
 
-# Updates the activity_data.json and returns json
+# Applies the new events to the activity data and returns it as json
 @app.route("/activity_data", methods=["GET"])
 def update_activity_data_endpoint():
     try:
         get_log_txt_from_server()
 
-        data = update_activity_data()
-        return jsonify(data)
+        return Response(update_activity_data(), mimetype="application/json")
     except Exception as e:
         return jsonify(error=str(e)), 500
 
@@ -36,14 +36,23 @@ class Element {
     }
 }
 
-let send_request = (method, url, data) => {
+// ETag of the latest response per url, a conditional request sends it back and resolves with null on 304
+let etags = {};
+
+let send_request = (method, url, data, conditional = false) => {
     return new Promise((resolve, reject) => {
         const xhr = new XMLHttpRequest();
         xhr.open(method, url, true);
         xhr.setRequestHeader('Content-Type', 'application/json');
+        if (conditional && etags[url]) xhr.setRequestHeader('If-None-Match', etags[url]);
 
         xhr.onload = function () {
+            if (conditional && xhr.status === 304) {  // the model did not change
+                resolve(null);
+                return;
+            }
             if (xhr.status >= 200 && xhr.status < 300) {
+                if (conditional && xhr.getResponseHeader('ETag')) etags[url] = xhr.getResponseHeader('ETag');
                 let responseData;
                 try {
                     responseData = JSON.parse(xhr.response);
@@ -222,6 +231,82 @@ update_mode_event_amount_input.addEventListener("input", () => {
 
 
 
+// Window selector: which instances the model is discovered from
+let window_selector_label = document.createElement("label");
+window_selector_label.textContent = "Discover from: ";
+window_selector_label.style.fontSize = "1.2em"
+window_selector_label.setAttribute("for", "window_modes");
+
+let window_modes = ["Whole history", "Last instances", "Last minutes"];
+let window_selector = document.createElement("select");
+window_selector.id = "window_modes";
+window_selector.style.margin = "0 10px 0 5px";
+window_selector.style.fontSize = "0.9em";
+
+window_modes.forEach(window_mode => {
+    let option = document.createElement("option");
+    option.value = window_mode;
+    option.textContent = window_mode;
+    if (window_mode === window_modes[0]) option.selected = true;
+    window_selector.appendChild(option);
+});
+
+let window_size_input = document.createElement("input");
+window_size_input.style.margin = "10px";
+window_size_input.style.width = "4em";
+window_size_input.id = "window_size_input";
+window_size_input.type = "number";
+window_size_input.value = "20";
+window_size_input.disabled = true;
+
+window_selector.addEventListener("change", () => {
+    window_size_input.disabled = window_selector.value === window_modes[0];
+    if (window_selector.value === window_modes[1]) window_size_input.value = "20";
+    if (window_selector.value === window_modes[2]) window_size_input.value = "10";
+});
+window_size_input.addEventListener("input", () => {
+    let value = parseInt(window_size_input.value);
+    if (isNaN(value) || value <= 0) {
+        window_size_input.value = "1";
+    }
+});
+
+// Noise threshold for filtering infrequent behaviour, empty for the server default
+let noise_threshold_label = document.createElement("label");
+noise_threshold_label.textContent = "Noise threshold: ";
+noise_threshold_label.style.fontSize = "1.2em"
+noise_threshold_label.setAttribute("for", "noise_threshold_input");
+
+let noise_threshold_input = document.createElement("input");
+noise_threshold_input.style.margin = "10px";
+noise_threshold_input.style.width = "4em";
+noise_threshold_input.id = "noise_threshold_input";
+noise_threshold_input.type = "number";
+noise_threshold_input.min = "0";
+noise_threshold_input.max = "1";
+noise_threshold_input.step = "0.05";
+noise_threshold_input.placeholder = "0.2";
+noise_threshold_input.addEventListener("input", () => {
+    let value = parseFloat(noise_threshold_input.value);
+    if (value < 0) noise_threshold_input.value = "0";
+    if (value > 1) noise_threshold_input.value = "1";
+});
+
+let get_noise_threshold = () => {
+    let value = parseFloat(noise_threshold_input.value);
+    return isNaN(value) ? null : value;
+}
+
+// {instances: N}, {minutes: M} or null for the whole history
+let get_selected_window = () => {
+    let size = parseInt(window_size_input.value);
+    if (window_selector.value === window_modes[1]) return {instances: size};
+    if (window_selector.value === window_modes[2]) return {minutes: size};
+    return null;
+}
+
+
+
 let refresh_download_button = () => {
     svg = graph_container.div.querySelector("svg");
     let created = export_button;
@@ -338,6 +423,7 @@ let button_container = new Element({}, "");
 
 
 let update_interval;
+let last_traces = "";
 /******************************** IBC - UPDATE INTERVAL ****************************/
 // each node has information on: process_name, instance_id and name/label
 
@@ -346,19 +432,26 @@ let update_interval_function = () => {
         stop_updating();
         return;
     }
-    send_request("POST", "digraph", {process_name: selection.process_name}).then(r => {
+    let selected_window = get_selected_window();
+    send_request("POST", "digraph", {
+        process_name: selection.process_name,
+        window: selected_window,
+        noise_threshold: get_noise_threshold()
+    }, true).then(r => {
         update_last_updated_label();
-        let dg = r.message;
-        if(dg.length > 0) {
-            update_graph_container(dg, selection.old_process === selection.process_name);
-        } else {
-            graph_container.text = "";
-        } send_request("POST", "traces", {process_name: selection.process_name}).then(r => {
+        if (r !== null) {  // null: unchanged model, the graph stays as it is
+            let dg = r.message;
+            if(dg.length > 0) {
+                update_graph_container(dg, selection.old_process === selection.process_name);
+            } else {
+                graph_container.text = "";
+            }
+        } send_request("POST", "traces", {process_name: selection.process_name, window: selected_window}, true).then(r => {
             traces_display_container.show();
-            let traces = r.message;
+            if (r !== null) last_traces = r.message;
             // Restart stopped instances
-            restart_stopped_instances(traces);
-            update_trace_information(traces);
+            restart_stopped_instances(last_traces);
+            if (r !== null) update_trace_information(last_traces);
         });
     });
 }
@@ -1047,6 +1140,11 @@ window.onload = () => {
     update_mode_selector_container.appendChild(update_mode_selector, false);
     update_mode_selector_container.appendChild(update_mode_event_label, false);
     update_mode_selector_container.appendChild(update_mode_event_amount_input, false);
+    update_mode_selector_container.appendChild(window_selector_label, false);
+    update_mode_selector_container.appendChild(window_selector, false);
+    update_mode_selector_container.appendChild(window_size_input, false);
+    update_mode_selector_container.appendChild(noise_threshold_label, false);
+    update_mode_selector_container.appendChild(noise_threshold_input, false);
 
 
     interaction_buttons_container.appendChild(button_container);
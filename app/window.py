@@ -0,0 +1,115 @@
+import collections
+import os
+from typing import List, Optional
+
+MICROSECONDS = 1_000_000  # unit of parse_timestamp
+
+
+class Window:
+    """
+    Selects the instances of a process model to mine: the `instances` most recently active instances and/or the
+    instances with an event in the last `seconds` before the newest event of the process model.
+    """
+
+    def __init__(self, instances: Optional[int] = None, seconds: Optional[float] = None):
+        self.instances = instances
+        self.seconds = seconds
+
+    def __repr__(self):
+        return f"Window(instances={self.instances}, seconds={self.seconds})"
+
+    @classmethod
+    def from_request(cls, data) -> Optional["Window"]:
+        """{"window": {"instances": 20}} or {"window": {"minutes": 10}}, None for the whole history."""
+        window = (data or {}).get("window") or {}
+        instances = window.get("instances")
+        seconds = window.get("seconds")
+        if window.get("minutes") is not None:
+            seconds = float(window["minutes"]) * 60
+        if instances is None and seconds is None:
+            return None
+        return cls(int(instances) if instances is not None else None, float(seconds) if seconds is not None else None)
+
+    @classmethod
+    def from_env(cls) -> Optional["Window"]:
+        """Retention of the in-memory state: RETAIN_INSTANCES and/or RETAIN_MINUTES, None keeps everything."""
+        return cls.from_request({"window": {"instances": os.environ.get("RETAIN_INSTANCES"),
+                                            "minutes": os.environ.get("RETAIN_MINUTES")}})
+
+
+class InstanceTimeline:
+    """
+    Instances of a process model, least recently active first. Events of an instance are mostly in timestamp order,
+    so the order by activity is also (almost) the order by newest timestamp.
+
+    Evicted instances are remembered while they may still run: overlapping instances can leave a retention window
+    before they end, their later events must be dropped instead of starting a fragment of the instance that evicts
+    the next one. An evicted instance is forgotten once none of its activities runs and it had no event for
+    evicted_seconds (there is no event for the end of an instance), or beyond max_evicted remembered instances.
+    """
+
+    def __init__(self, max_evicted=1000, evicted_seconds=600):
+        self.last_seen = collections.OrderedDict()  # instance -> newest timestamp, least recently active first
+        self.newest = None
+        # evicted instance -> [newest timestamp, running activities], least recently active first
+        self.evicted = collections.OrderedDict()
+        self.max_evicted = max_evicted
+        self.evicted_seconds = evicted_seconds
+
+    def __len__(self):
+        return len(self.last_seen)
+
+    def touch(self, instance, timestamp: int):
+        self.last_seen[instance] = max(self.last_seen.get(instance, timestamp), timestamp)
+        self.last_seen.move_to_end(instance)
+        self.newest = timestamp if self.newest is None else max(self.newest, timestamp)
+
+    def evict(self, instance, running=0):
+        timestamp = self.last_seen.pop(instance, None)
+        if timestamp is None:
+            return
+        self.evicted[instance] = [timestamp, running]
+        oldest = self.newest - self.evicted_seconds * MICROSECONDS
+        while self.evicted:  # least recently active first
+            first, (timestamp, running) = next(iter(self.evicted.items()))
+            if len(self.evicted) <= self.max_evicted and (timestamp >= oldest or running > 0):
+                break
+            del self.evicted[first]
+
+    def drops(self, instance, timestamp: int, started: int) -> bool:
+        """Whether an event of the instance is dropped as it was evicted, started: +1 start, -1 completion."""
+        entry = self.evicted.get(instance)
+        if entry is None:
+            return False
+        entry[0], entry[1] = max(entry[0], timestamp), entry[1] + started
+        self.evicted.move_to_end(instance)
+        return True
+
+    def select(self, window: Optional[Window]) -> List[object]:
+        """Instances inside the window, least recently active first."""
+        if self.newest is None:  # no events yet
+            return []
+        instances = list(self.last_seen)
+        if window is None:
+            return instances
+        if window.instances is not None:
+            instances = instances[max(len(instances) - window.instances, 0):]
+        if window.seconds is not None:
+            oldest = self.newest - window.seconds * MICROSECONDS
+            instances = [instance for instance in instances if self.last_seen[instance] >= oldest]
+        return instances
+
+    def expired(self, window: Optional[Window]) -> List[object]:
+        """Instances that left the window, found from the least recently active on without looking at the others."""
+        expired = []
+        if window is None or self.newest is None:
+            return expired
+        oldest = self.newest - window.seconds * MICROSECONDS if window.seconds is not None else None
+        for instance, timestamp in self.last_seen.items():
+            if window.instances is not None and len(self.last_seen) - len(expired) > window.instances:
+                expired.append(instance)
+            elif oldest is not None and timestamp < oldest:
+                expired.append(instance)
+            else:
+                break
+        return expired
@@ -0,0 +1,200 @@
+"""
+Stage-level benchmark of the miner on synthetic logs, written as JSON to compare versions:
+
+    python -m benchmarks.bench_miner --out bench.json
+    python -m benchmarks.bench_miner --quick --no-random  # only the CPEE models in processes/*.xml
+"""
+import argparse
+import itertools
+import json
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from contextlib import contextmanager
+from datetime import datetime
+
+import app.InduciveMinerLifeCycle as imlc
+from app.InduciveMinerLifeCycle import Activity, Alphabet, InductiveMinerLifeCycle, correct_incomplete_traces, \
+    get_ccg_from_expanded_traces, get_dfg_from_expanded_traces, get_variants, subtree_cache
+from app.PetriNetIMLC import PetriNetIMLC
+from app.event_store import EventStore
+from app.miner import dot_cache, get_digraph_from_custom_petri_net
+from benchmarks.log_generator import generate_log, get_cpee_models, random_tree, tree_to_string
+
+CUT_DETECTORS = ["find_sequence_cuts", "find_interleaved_cuts", "find_parallel_cuts", "find_exclusive_cuts",
+                 "find_loop_cut"]
+ABSTRACTIONS = ["correct_incomplete_traces", "get_dfg_from_expanded_traces", "get_ccg_from_expanded_traces",
+                "filter_dfg", "filter_ccg"]
+
+
+class StageTimer:
+    """Accumulated time and calls of the cut detectors and abstractions while mining, over all sublogs."""
+
+    def __init__(self):
+        self.seconds, self.calls = {}, {}
+
+    def wrap(self, name, function):
+        def timed(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                self.seconds[name] = self.seconds.get(name, 0) + time.perf_counter() - start
+                self.calls[name] = self.calls.get(name, 0) + 1
+
+        return timed
+
+    @contextmanager
+    def patch(self):
+        originals = [(InductiveMinerLifeCycle, name, getattr(InductiveMinerLifeCycle, name)) for name in CUT_DETECTORS]
+        originals += [(imlc, name, getattr(imlc, name)) for name in ABSTRACTIONS]
+        for owner, name, function in originals:
+            setattr(owner, name, self.wrap(name, function))
+        try:
+            yield self
+        finally:
+            for owner, name, function in originals:
+                setattr(owner, name, function)
+
+
+def load_traces(path, process_name):
+    """The traces of a process model as the server reads them (see miner.get_traces_from_log)."""
+    event_store = EventStore(path)
+    event_store.sync()
+    event_types = {"calling": "s", "done": "c"}
+    return [[Activity(activity, event_types[event], label) for _, activity, event, label in events
+             if event in event_types]
+            for _, events in event_store.get_instances(process_name)]
+
+
+def measure(function):
+    start = time.perf_counter()
+    result = function()
+    return result, time.perf_counter() - start
+
+
+def bench_log(lines, process_name, repeat=3, noise_threshold=0.0):
+    """Times every stage on a log, each repetition mines from scratch (empty subtree and DOT cache)."""
+    with tempfile.NamedTemporaryFile("w", suffix=".txt", delete=False) as f:
+        f.write("\n".join(lines) + "\n")
+    runs = []
+    try:
+        for _ in range(repeat):
+            run = {}
+            traces, run["load_traces"] = measure(lambda: load_traces(f.name, process_name))
+            alphabet = Alphabet()
+            variants, run["encode_variants"] = measure(lambda: get_variants(alphabet.encode_traces(traces)))
+            variants, run["correct_incomplete_traces"] = measure(lambda: correct_incomplete_traces(variants))
+            _, run["dfg"] = measure(lambda: get_dfg_from_expanded_traces(variants, alphabet.labels))
+            _, run["ccg"] = measure(lambda: get_ccg_from_expanded_traces(variants))
+
+            subtree_cache.entries.clear()
+            with StageTimer().patch() as timer:
+                def mine():
+                    miner = InductiveMinerLifeCycle(traces, noise_threshold=noise_threshold)
+                    miner.find_sublogs_cuts()
+                    return miner
+
+                miner, run["mining"] = measure(mine)
+            for name in CUT_DETECTORS + ABSTRACTIONS:
+                run[f"mining.{name}"] = timer.seconds.get(name, 0.0)
+                run[f"mining.{name}.calls"] = timer.calls.get(name, 0)
+
+            petri_net, run["petri_net"] = measure(lambda: PetriNetIMLC(miner))
+            dot_cache.entries.clear()
+            _, run["dot"] = measure(lambda: get_digraph_from_custom_petri_net(petri_net))
+            runs.append(run)
+    finally:
+        os.remove(f.name)
+
+    stages = {}
+    for name in runs[0]:
+        values = [run[name] for run in runs]
+        if name.endswith(".calls"):
+            stages[name[:-len(".calls")]]["calls"] = values[0]
+        else:
+            stages[name] = {"median": statistics.median(values), "min": min(values)}
+    return {
+        "instances": len(traces),
+        "events": sum(map(len, traces)),
+        "activities": len({a.label for trace in traces for a in trace}),
+        "variants": len(variants),
+        "mean_trace_length": sum(map(len, traces)) / max(len(traces), 1),
+        "process_tree": miner.process_tree,
+        "stages": stages,
+    }
+
+
+def get_version():
+    try:
+        return subprocess.run(["git", "describe", "--always", "--dirty"], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        return None
+
+
+def get_cases(args):
+    """(name, parameters, tree) of the random trees (all combinations of the sizes) and the CPEE models."""
+    cases = []
+    if args.random:
+        for seed, activities, concurrency in itertools.product(range(args.seeds), args.activities, args.concurrency):
+            tree = random_tree(random.Random(seed), activities, concurrency)
+            cases.append(("random", {"seed": seed, "activities": activities, "concurrency": concurrency}, tree))
+    if args.cpee:
+        for process_name, tree in get_cpee_models().items():
+            cases.append((process_name, {}, tree))
+    return cases
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--out", help="JSON output file, stdout if omitted")
+    parser.add_argument("--instances", type=int, nargs="+", default=[50, 200, 1000])
+    parser.add_argument("--activities", type=int, nargs="+", default=[5, 10, 20])
+    parser.add_argument("--concurrency", type=float, nargs="+", default=[0.0, 0.25, 0.5])
+    parser.add_argument("--loop", type=float, nargs="+", default=[0.3], help="probability to repeat a loop")
+    parser.add_argument("--noise", type=float, nargs="+", default=[0.0, 0.05], help="share of noisy instances")
+    parser.add_argument("--noise-threshold", type=float, default=0.0, help="IMf filtering while mining")
+    parser.add_argument("--seeds", type=int, default=2, help="random trees per size")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--no-random", dest="random", action="store_false", help="skip the random trees")
+    parser.add_argument("--no-cpee", dest="cpee", action="store_false", help="skip processes/*.xml")
+    parser.add_argument("--quick", action="store_true", help="small sizes for a smoke run")
+    args = parser.parse_args(argv)
+    if args.quick:
+        args.instances, args.activities, args.concurrency, args.noise = [50], [5], [0.25], [0.0]
+        args.seeds, args.repeat = 1, 1
+
+    results = []
+    for (name, parameters, tree), instances, loop, noise in itertools.product(get_cases(args), args.instances,
+                                                                              args.loop, args.noise):
+        parameters = dict(parameters, instances=instances, loop=loop, noise=noise)
+        lines = generate_log(tree, name, instances, noise, loop, seed=parameters.get("seed", 0))
+        result = bench_log(lines, name, args.repeat, args.noise_threshold)
+        results.append(dict({"name": name, "parameters": parameters, "tree": tree_to_string(tree)}, **result))
+        print(f"{name} {parameters}: {result['events']} events, mining {result['stages']['mining']['median']:.4f}s",
+              file=sys.stderr)
+
+    report = {
+        "version": get_version(),
+        "created": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "noise_threshold": args.noise_threshold,
+        "repeat": args.repeat,
+        "results": results,
+    }
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
+    else:
+        json.dump(report, sys.stdout, indent=2, ensure_ascii=False)
+
+
+if __name__ == "__main__":
+    main()
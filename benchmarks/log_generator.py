@@ -0,0 +1,175 @@
+import glob
+import json
+import os
+import random
+import xml.etree.ElementTree as ET
+from datetime import datetime, timedelta, timezone
+from typing import List, Tuple
+
+# Process trees: ("task", activity, label), ("tau",) or (operator, [children]) with operator seq, xor, and, loop.
+# A loop (do, redo) executes do, then redo and do again as long as it repeats.
+OPERATORS = ["seq", "xor", "and", "loop"]
+
+CPEE_NS = "{http://cpee.org/ns/description/1.0}"
+PROCESSES_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "processes")
+
+# (seconds since the start of the instance, activity, event, label)
+Event = Tuple[float, str, str, str]
+
+
+def random_tree(rng: random.Random, activities: int, concurrency=0.25, max_depth=4):
+    """
+    Random block-structured tree over the activities a1..aN. concurrency is the share of parallel operators, the
+    others are split evenly between sequence, choice and loop.
+    """
+    tasks = [("task", f"a{i + 1}", f"a{i + 1}") for i in range(activities)]
+    weights = [(1 - concurrency) / 3, (1 - concurrency) / 3, concurrency, (1 - concurrency) / 3]
+
+    def build(tasks, depth):
+        if len(tasks) == 1:
+            return tasks[0]
+        if depth >= max_depth:
+            return "seq", tasks
+        operator = rng.choices(OPERATORS, weights)[0]
+        k = 2 if operator == "loop" else rng.randint(2, min(4, len(tasks)))
+        cuts = sorted(rng.sample(range(1, len(tasks)), k - 1))
+        parts = [tasks[i:j] for i, j in zip([0] + cuts, cuts + [len(tasks)])]
+        return operator, [build(part, depth + 1) for part in parts]
+
+    return build(tasks, 0)
+
+
+def parse_cpee_model(path):
+    """Process tree of a CPEE model: calls and manipulates are tasks, pre-test loops are loops (τ, body)."""
+    description = ET.parse(path).getroot().find(f".//{CPEE_NS}description")
+
+    def sequence(element):
+        children = [tree for tree in map(parse, element) if tree is not None]
+        if not children:
+            return ("tau",)
+        return children[0] if len(children) == 1 else ("seq", children)
+
+    def parse(element):
+        tag = element.tag.replace(CPEE_NS, "")
+        if tag in ("call", "manipulate"):
+            label = element.find(f"{CPEE_NS}parameters/{CPEE_NS}label")
+            label = label.text if label is not None and label.text else element.get("label", element.get("id"))
+            return "task", element.get("id"), label
+        if tag == "parallel":
+            # branches can also be spawned by a loop inside the parallel, it is one branch here
+            branches = [tree for tree in map(parse, element) if tree is not None]
+            return branches[0] if len(branches) == 1 else ("and", branches)
+        if tag == "choose":
+            return "xor", [sequence(branch) for branch in element
+                           if branch.tag in (f"{CPEE_NS}alternative", f"{CPEE_NS}otherwise")]
+        if tag == "loop":
+            return "loop", [("tau",), sequence(element)]
+        if tag in ("parallel_branch", "critical", "group"):
+            return sequence(element)
+        return None  # annotations, _probability, ...
+
+    return sequence(description)
+
+
+def get_cpee_models(directory=PROCESSES_DIR):
+    """process name -> process tree of every processes/*.xml"""
+    return {os.path.splitext(os.path.basename(path))[0]: parse_cpee_model(path)
+            for path in sorted(glob.glob(os.path.join(directory, "*.xml")))}
+
+
+def tree_activities(tree) -> List[Tuple[str, str]]:
+    if tree[0] == "task":
+        return [tree[1:]]
+    if tree[0] == "tau":
+        return []
+    return [activity for child in tree[1] for activity in tree_activities(child)]
+
+
+def tree_to_string(tree) -> str:
+    if tree[0] == "task":
+        return tree[1]
+    if tree[0] == "tau":
+        return "τ"
+    symbols = {"seq": "→", "xor": "×", "and": "+", "loop": "◯"}
+    return symbols[tree[0]] + "(" + ",".join(tree_to_string(child) for child in tree[1]) + ")"
+
+
+def simulate(rng: random.Random, tree, loop=0.3, max_duration=5.0, max_delay=2.0) -> List[Event]:
+    """Events of one execution of the tree, sorted by time. Parallel branches start with a random delay."""
+
+    def play(tree, time) -> Tuple[List[Event], float]:
+        operator = tree[0]
+        if operator == "task":
+            end = time + rng.uniform(0.1, max_duration)
+            return [(time, tree[1], "calling", tree[2]), (end, tree[1], "done", tree[2])], end
+        if operator == "tau":
+            return [], time
+        children = tree[1]
+        if operator == "seq":
+            events = []
+            for child in children:
+                child_events, time = play(child, time)
+                events += child_events
+            return events, time
+        if operator == "xor":
+            return play(rng.choice(children), time)
+        if operator == "and":
+            events, end = [], time
+            for child in children:
+                child_events, child_end = play(child, time + rng.uniform(0, max_delay))
+                events += child_events
+                end = max(end, child_end)
+            return events, end
+        if operator == "loop":
+            events, time = play(children[0], time)
+            while rng.random() < loop:
+                for child in (children[1], children[0]):
+                    child_events, time = play(child, time)
+                    events += child_events
+            return events, time
+        raise ValueError(f"Unknown operator {operator}")
+
+    return sorted(play(tree, 0.0)[0], key=lambda event: event[0])
+
+
+def add_noise(rng: random.Random, events: List[Event], activities: List[Tuple[str, str]]) -> List[Event]:
+    """Removes an event, swaps two neighbouring events or inserts an execution of a random activity."""
+    times = [event[0] for event in events]
+    events = [event[1:] for event in events]
+    kind = rng.choice(["remove", "swap", "insert"])
+    if kind == "remove" and events:
+        del times[-1], events[rng.randrange(len(events))]
+    elif kind == "swap" and len(events) > 1:
+        i = rng.randrange(len(events) - 1)
+        events[i], events[i + 1] = events[i + 1], events[i]
+    else:
+        activity, label = rng.choice(activities)
+        i = rng.randint(0, len(events))
+        time = times[i - 1] if i else 0.0
+        times[i:i] = [time, time]
+        events[i:i] = [(activity, "calling", label), (activity, "done", label)]
+    return [(time,) + event for time, event in zip(times, events)]
+
+
+def generate_log(tree, process_name="benchmark", instances=100, noise=0.0, loop=0.3, seed=0,
+                 instance_interval=1.0) -> List[str]:
+    """
+    log.txt lines of the given number of instances, as logged from CPEE: a new instance every instance_interval
+    seconds, the lines of all instances in timestamp order. A share noise of the instances gets add_noise.
+    """
+    rng = random.Random(seed)
+    activities = tree_activities(tree) or [("a1", "a1")]
+    start = datetime(2024, 1, 1, tzinfo=timezone.utc)
+    entries = []
+    for instance in range(1, instances + 1):
+        events = simulate(rng, tree, loop)
+        if rng.random() < noise:
+            events = add_noise(rng, events, activities)
+        offset = (instance - 1) * instance_interval
+        for time, activity, event, label in events:
+            entries.append((offset + time, len(entries), {
+                "instance_name": process_name, "instance": instance,
+                "timestamp": (start + timedelta(seconds=offset + time)).isoformat(), "activity": activity,
+                "event": event, "label": label}))
+    entries.sort(key=lambda entry: entry[:2])
+    return [json.dumps(entry[2]) for entry in entries]
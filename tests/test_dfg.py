@@ -0,0 +1,26 @@
+from app.InduciveMinerLifeCycle import Activity, Alphabet, get_dfg_from_expanded_traces, \
+    get_start_end_activities_from_trace
+from app.StreamingIMLC import LifeCycleStream
+
+TRACE = [("a1", "s"), ("a1", "c"), ("a2", "s"), ("a2", "s"), ("a2", "c"), ("a2", "c")]
+
+
+def test_start_end_activities_are_distinct():
+    alphabet = Alphabet()
+    trace = [alphabet.encode(Activity(label, event_type)) for label, event_type in TRACE]
+    starts, ends = get_start_end_activities_from_trace(tuple(trace))
+    assert len(ends) == len(set(ends)) == 1
+    assert len(starts) == len(set(starts))
+
+
+def test_end_activity_counts_match_the_stream():
+    alphabet = Alphabet()
+    variants = alphabet.encode_traces([[Activity(label, event_type) for label, event_type in TRACE]] * 3)
+    dfg = get_dfg_from_expanded_traces(variants, alphabet.labels)
+    stream = LifeCycleStream(alphabet)
+    for instance in range(3):
+        for label, event_type in TRACE:
+            stream.add_event(instance, Activity(label, event_type))
+    a2 = alphabet.ids["a2"] << 2
+    assert dfg.end_activities[a2] == stream.dfg.end_activities[a2] == 3
+    assert dfg.start_activities == stream.dfg.start_activities
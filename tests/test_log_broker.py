@@ -0,0 +1,49 @@
+import threading
+import time
+
+from app.log_broker import LogBroker
+
+
+class CountingTail:
+    """Stand-in for RemoteLogTail: every fetch appends one line."""
+
+    def __init__(self):
+        self.line_count = 0
+        self.fetches = 0
+        self.lock = threading.Lock()
+
+    def fetch(self):
+        with self.lock:
+            self.fetches += 1
+            self.line_count += 1
+        return [str(self.line_count)]
+
+
+def test_polls_only_while_subscribed():
+    tail = CountingTail()
+    broker = LogBroker(tail, interval=.01)
+    assert not broker.polling()
+    subscriber = broker.subscribe()
+    assert broker.polling()
+    assert subscriber.get(timeout=1) >= 1
+    broker.unsubscribe(subscriber)
+    assert not broker.polling()
+    time.sleep(.05)  # a fetch in progress may still finish
+    fetches = tail.fetches
+    time.sleep(.1)
+    assert tail.fetches == fetches
+
+
+def test_resumes_the_same_loop():
+    tail = CountingTail()
+    broker = LogBroker(tail, interval=.01)
+    first = broker.subscribe()
+    thread = broker.thread
+    broker.unsubscribe(first)
+    second, third = broker.subscribe(), broker.subscribe()
+    assert broker.thread is thread and thread.is_alive()
+    assert second.get(timeout=1) >= 1 and third.get(timeout=1) >= 1
+    broker.unsubscribe(second)
+    assert broker.polling()
+    broker.unsubscribe(third)
+    assert not broker.polling()
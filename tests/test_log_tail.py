@@ -0,0 +1,126 @@
+import http.server
+import re
+import threading
+
+import pytest
+
+from app.log_tail import RemoteLogTail
+
+
+class StandInHandler(http.server.BaseHTTPRequestHandler):
+    """Serves server.content, with byte ranges unless server.ranges is False. server.status answers ranges instead."""
+
+    def do_GET(self):
+        content, server = self.server.content, self.server
+        server.requests.append(self.headers.get("Range"))
+        match = re.match(r"bytes=(\d+)-$", self.headers.get("Range") or "")
+        if match and server.status is not None:
+            self.send_response(server.status)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+        elif match and server.ranges:
+            start = int(match.group(1))
+            if start >= len(content):
+                self.send_response(416)
+                self.send_header("Content-Range", f"bytes */{len(content)}")
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+                return
+            self.send_response(206)
+            self.send_header("Content-Range", f"bytes {start}-{len(content) - 1}/{len(content)}")
+            self.send_header("Content-Length", str(len(content) - start))
+            self.end_headers()
+            self.wfile.write(content[start:])
+        else:
+            self.send_response(200)
+            self.send_header("Content-Length", str(len(content)))
+            self.end_headers()
+            self.wfile.write(content)
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture
+def server():
+    server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), StandInHandler)
+    server.content, server.ranges, server.status, server.requests = b"", True, None, []
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def tail(server, tmp_path):
+    return RemoteLogTail(f"http://127.0.0.1:{server.server_port}/log.txt", str(tmp_path / "log.txt"))
+
+
+def read(tail):
+    with open(tail.local_path, "rb") as f:
+        return f.read()
+
+
+def test_appended_lines_are_requested_as_range(server, tail):
+    server.content = b"1\n2\n"
+    assert tail.fetch() == ["1", "2"]
+    server.content += b"3\n"
+    assert tail.fetch() == ["3"]
+    assert server.requests == [None, "bytes=2-"]  # from the last line on, to notice a truncation
+    assert read(tail) == server.content
+    assert not tail.truncated
+
+
+def test_nothing_new(server, tail):
+    server.content = b"1\n2\n"
+    tail.fetch()
+    assert tail.fetch() == []
+    server.status = 416  # a server that rejects the range although the log did not change
+    assert tail.fetch() == []
+    assert read(tail) == server.content
+    assert not tail.truncated
+
+
+def test_full_body_fallback(server, tail):
+    server.ranges = False
+    server.content = b"1\n2\n"
+    assert tail.fetch() == ["1", "2"]
+    server.content += b"3\n4\n"
+    assert tail.fetch() == ["3", "4"]
+    assert tail.fetch() == []
+    assert read(tail) == server.content
+    assert not tail.truncated
+
+
+@pytest.mark.parametrize("ranges", [True, False])
+def test_truncated_remote_log(server, tail, ranges):
+    server.ranges = ranges
+    server.content = b"1\n2\n3\n"
+    tail.fetch()
+    server.content = b"4\n"  # shorter than the cursor (416 with ranges)
+    assert tail.fetch() == ["4"]
+    assert tail.truncated
+    server.content = b"5\n6\n7\n8\n"  # longer, but the last mirrored line changed
+    assert tail.fetch() == ["5", "6", "7", "8"]
+    assert tail.truncated
+    assert read(tail) == server.content
+
+
+def test_partial_last_line(server, tail):
+    server.content = b"1\n2"
+    assert tail.fetch() == ["1"]
+    assert read(tail) == b"1\n"
+    server.content += b"2\n3"
+    assert tail.fetch() == ["22"]
+    assert read(tail) == b"1\n22\n"
+    assert not tail.truncated
+
+
+def test_resumes_from_local_file(server, tail):
+    server.content = b"1\n2\n"
+    tail.fetch()
+    server.content += b"3\n"
+    restarted = RemoteLogTail(tail.url, tail.local_path)
+    assert restarted.fetch() == ["3"]
+    assert read(restarted) == server.content
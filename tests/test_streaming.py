@@ -0,0 +1,56 @@
+import random
+
+from app.InduciveMinerLifeCycle import Activity, Alphabet, get_dfg_from_expanded_traces
+from app.StreamingIMLC import LifeCycleStream, LifeCycleStreams
+from app.window import Window
+from benchmarks.log_generator import generate_log, random_tree
+
+
+def abstractions(stream):
+    return (stream.dfg.successors, stream.dfg.start_activities, stream.dfg.end_activities, stream.ccg.frequencies)
+
+
+def test_only_running_instances_keep_a_state():
+    lines = generate_log(random_tree(random.Random(1), 8, .4), "p", 2000, seed=1, instance_interval=3)
+    streams, tallied = LifeCycleStreams("/nonexistent"), LifeCycleStreams("/nonexistent", Window(10 ** 6))
+    running = 0
+    for line in lines:
+        streams.insert(line)
+        tallied.insert(line)
+        running = max(running, len(streams.processes["p"].instances))
+    stream = streams.processes["p"]
+    assert running < 20 and not stream.instances
+    assert len(stream.settled) == 2000 and len(stream.settled_states) < 1000
+    assert abstractions(stream) == abstractions(tallied.processes["p"])
+
+
+def test_settled_instances_continue():
+    trace = [("a", "s"), ("a", "c"), ("b", "s"), ("c", "s"), ("b", "c"), ("c", "c"), ("a", "s"), ("a", "c")]
+    alphabet = Alphabet()
+    dfg = get_dfg_from_expanded_traces(alphabet.encode_traces([[Activity(*event) for event in trace]] * 2),
+                                       alphabet.labels)
+    stream = LifeCycleStream(alphabet, False)
+    for event in trace:  # interleaved, both instances settle after every completion but the one of b
+        for instance in (1, 2):
+            stream.add_event(instance, Activity(*event))
+    assert stream.dfg.successors == dfg.successors
+    assert stream.dfg.start_activities == dfg.start_activities
+    assert stream.dfg.end_activities == dfg.end_activities
+    assert stream.ccg.frequencies == {(min(b, c), max(b, c)): 2 for b, c in [(alphabet.ids["b"] << 2,
+                                                                              alphabet.ids["c"] << 2)]}
+    assert set(stream.settled) == {1, 2} and len(stream.settled_states) == 1
+
+
+def test_evicting_settled_instances():
+    lines = generate_log(random_tree(random.Random(2), 6, .4), "p", 300, seed=2)
+    streams = LifeCycleStreams("/nonexistent", Window(5))
+    for line in lines:
+        streams.insert(line)
+    stream = streams.processes["p"]
+    assert len(stream.settled) + len(stream.instances) <= 5
+    assert sum(users for _, users in stream.settled_states.values()) == len(stream.settled)
+    for instance in stream.timeline.select(None):
+        stream.evict(instance)
+    assert not stream.settled_states
+    assert not stream.dfg.start_activities and not stream.dfg.end_activities and not stream.ccg.frequencies
+    assert all(not successors for successors in stream.dfg.successors.values())
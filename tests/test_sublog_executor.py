@@ -0,0 +1,60 @@
+import random
+
+import pytest
+
+from app import InduciveMinerLifeCycle
+from app.InduciveMinerLifeCycle import Activity, InductiveMinerLifeCycle, SublogExecutor, SubtreeCache
+from app.StreamingIMLC import EVENT_TYPES
+from benchmarks.log_generator import random_tree, simulate
+
+
+def get_logs():
+    logs = []
+    for seed in range(4):
+        rng = random.Random(seed)
+        tree = ("and", [random_tree(rng, 4, .4), random_tree(rng, 4, .4)])  # at least two sibling sublogs
+        logs.append([[Activity(activity + str(seed), EVENT_TYPES[event], label)
+                      for _, activity, event, label in simulate(rng, tree)] for _ in range(60)])
+    return logs
+
+
+def mine(log):
+    miner = InductiveMinerLifeCycle(log)
+    miner.find_sublogs_cuts()
+    return miner.process_tree
+
+
+@pytest.fixture
+def executor(monkeypatch):
+    executor = SublogExecutor(2, 1)
+    monkeypatch.setattr(InduciveMinerLifeCycle, "sublog_executor", executor)
+    yield executor
+    executor.reset_pool()
+
+
+def mine_all(logs, monkeypatch):
+    trees = []
+    for log in logs:
+        monkeypatch.setattr(InduciveMinerLifeCycle, "subtree_cache", SubtreeCache())
+        trees.append(mine(log))
+    return trees
+
+
+def test_pool_mines_the_inline_trees(executor, monkeypatch, capsys):
+    logs = get_logs()
+    executor.workers = 0
+    inline = mine_all(logs, monkeypatch)
+    executor.workers = 2
+    assert mine_all(logs, monkeypatch) == inline
+    assert "failed" not in capsys.readouterr().out
+    assert executor.pool is not None
+    assert executor.pool._mp_context.get_start_method() != "fork"
+
+
+def test_timeout_mines_inline(executor, monkeypatch):
+    logs = get_logs()
+    executor.workers = 0
+    inline = mine_all(logs, monkeypatch)
+    executor.workers, executor.timeout = 2, 0
+    assert mine_all(logs, monkeypatch) == inline
+    assert executor.pool is None  # replaced on the next sublogs
@@ -0,0 +1,48 @@
+import random
+
+import pytest
+
+from app import InduciveMinerLifeCycle
+from app.InduciveMinerLifeCycle import Activity, InductiveMinerLifeCycle, SubtreeCache
+from app.StreamingIMLC import EVENT_TYPES
+from benchmarks.log_generator import random_tree, simulate
+
+
+def activities(*events):
+    return [Activity(label, event_type) for label, event_type in events]
+
+
+# the sublog of b in the parallel cut gets τ variants, they are dropped up to the number of partitions
+SKIPPED_B = [activities(("a", "s"), ("b", "s"), ("a", "c"), ("b", "c")),
+             activities(("b", "s"), ("a", "s"), ("b", "c"), ("a", "c"))]
+ONLY_A = activities(("a", "s"), ("a", "c"))
+
+
+def get_traces(seed, instances):
+    rng = random.Random(seed)
+    tree = random_tree(rng, 6, .4)
+    return [[Activity(activity, EVENT_TYPES[event], label) for _, activity, event, label in simulate(rng, tree)]
+            for _ in range(instances)]
+
+
+def mine(traces, noise_threshold):
+    miner = InductiveMinerLifeCycle(traces, noise_threshold=noise_threshold)
+    miner.find_sublogs_cuts()
+    return miner.process_tree
+
+
+@pytest.mark.parametrize("noise_threshold", [0.0, 0.2])
+def test_warm_cache_mines_the_cold_tree(monkeypatch, noise_threshold):
+    logs = [get_traces(seed, 40) for seed in range(8)]
+    rng = random.Random(0)
+    for log in list(logs):  # the same variants with other counts, as after a refresh
+        logs.append(log + [rng.choice(log) for _ in range(rng.randint(1, 80))])
+    logs += [SKIPPED_B + [ONLY_A] * only_a for only_a in (1, 5)]
+    cold = []
+    for log in logs:
+        monkeypatch.setattr(InduciveMinerLifeCycle, "subtree_cache", SubtreeCache())
+        cold.append(mine(log, noise_threshold))
+    cache = SubtreeCache()
+    monkeypatch.setattr(InduciveMinerLifeCycle, "subtree_cache", cache)
+    assert [mine(log, noise_threshold) for log in logs + logs[::-1]] == cold + cold[::-1]
+    assert cache.hits
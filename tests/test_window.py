@@ -0,0 +1,106 @@
+import json
+import random
+
+import pytest
+
+from app.event_store import EventStore
+from app.StreamingIMLC import LifeCycleStreams
+from app.window import MICROSECONDS, InstanceTimeline, Window
+from benchmarks.log_generator import generate_log, random_tree
+
+
+@pytest.mark.parametrize("data, instances, seconds", [
+    (None, None, None), ({}, None, None), ({"window": None}, None, None), ({"window": {}}, None, None),
+    ({"window": {"instances": 20}}, 20, None), ({"window": {"instances": "20"}}, 20, None),
+    ({"window": {"minutes": 10}}, None, 600), ({"window": {"seconds": 30}}, None, 30),
+    ({"window": {"instances": 5, "minutes": "1.5"}}, 5, 90)])
+def test_window_from_request(data, instances, seconds):
+    window = Window.from_request(data)
+    if instances is None and seconds is None:
+        assert window is None
+    else:
+        assert (window.instances, window.seconds) == (instances, seconds)
+
+
+def test_window_from_env(monkeypatch):
+    monkeypatch.delenv("RETAIN_INSTANCES", raising=False)
+    monkeypatch.delenv("RETAIN_MINUTES", raising=False)
+    assert Window.from_env() is None
+    monkeypatch.setenv("RETAIN_MINUTES", "2")
+    assert (Window.from_env().instances, Window.from_env().seconds) == (None, 120)
+
+
+def get_timeline():
+    timeline = InstanceTimeline()
+    for instance, second in [(1, 0), (2, 1), (1, 2), (3, 4), (4, 10)]:
+        timeline.touch(instance, second * MICROSECONDS)
+    return timeline
+
+
+def test_select():
+    assert InstanceTimeline().select(None) == InstanceTimeline().select(Window(3)) == []
+    timeline = get_timeline()
+    assert timeline.select(None) == [2, 1, 3, 4]
+    assert timeline.select(Window(2)) == [3, 4]
+    assert timeline.select(Window(10)) == [2, 1, 3, 4]
+    assert timeline.select(Window(None, 6)) == [3, 4]  # an event at or after second 4
+    assert timeline.select(Window(1, 6)) == [4]
+
+
+def test_expired():
+    assert InstanceTimeline().expired(Window(1)) == []
+    timeline = get_timeline()
+    assert timeline.expired(None) == []
+    assert timeline.expired(Window(3)) == [2]
+    assert timeline.expired(Window(None, 7)) == [2, 1]
+    assert timeline.expired(Window(3, 6)) == [2, 1]
+
+
+def test_evicted_instances_are_forgotten():
+    timeline = InstanceTimeline(max_evicted=4, evicted_seconds=5)
+    for instance in range(10):
+        timeline.touch(instance, instance * MICROSECONDS)
+        timeline.evict(instance, running=1 if instance == 6 else 0)
+    assert list(timeline.evicted) == [6, 7, 8, 9]  # 6 still runs, 5 is older than 5 seconds
+    assert timeline.drops(6, 9 * MICROSECONDS, -1) and not timeline.drops(5, 9 * MICROSECONDS, 1)
+    timeline.touch(10, 10 * MICROSECONDS)
+    timeline.evict(10)
+    assert list(timeline.evicted) == [8, 9, 6, 10]  # at most 4
+    timeline.touch(11, 20 * MICROSECONDS)
+    timeline.evict(11)
+    assert list(timeline.evicted) == [11]
+    timeline.evict(12)  # never seen
+    assert list(timeline.evicted) == [11]
+
+
+@pytest.mark.parametrize("reader", [EventStore, LifeCycleStreams])
+@pytest.mark.parametrize("retention", [Window(10), Window(None, 20)])
+def test_retention(tmp_path, reader, retention):
+    lines = generate_log(random_tree(random.Random(3), 6, .3), "p", 1000, seed=3, instance_interval=2)
+    path = tmp_path / "log.txt"
+    path.write_text("\n".join(lines) + "\n")
+    retained = reader(str(path), retention)
+    retained.sync()
+    timeline = retained.timelines["p"] if reader is EventStore else retained.processes["p"].timeline
+    kept = timeline.select(None)
+    assert len(kept) <= (retention.instances or 20)
+    assert len(timeline.evicted) < 400  # 10 minutes of instances, not all of them
+    # no fragments of evicted instances: the same as reading the kept instances only
+    path.write_text("\n".join(line for line in lines if json.loads(line)["instance"] in kept) + "\n")
+    fresh = reader(str(path))
+    fresh.sync()
+    if reader is EventStore:
+        assert retained.get_instances("p") == fresh.get_instances("p")
+    else:
+        assert get_abstractions(retained) == get_abstractions(fresh)
+
+
+def get_abstractions(streams):
+    """DFG, start/end activities and CCG by label and lifecycle, the codes depend on the order of the log."""
+    stream = streams.processes["p"]
+    decode = lambda a: streams.alphabet.labels[a >> 2] + "-sc"[a & 3]
+    dfg = {(decode(a), decode(b)): n for a, successors in stream.dfg.successors.items()
+           for b, n in successors.items() if n}
+    ccg = {frozenset((decode(a), decode(b))): n for (a, b), n in stream.ccg.frequencies.items() if n}
+    return (dfg, {decode(a): n for a, n in stream.dfg.start_activities.items()},
+            {decode(a): n for a, n in stream.dfg.end_activities.items()}, ccg)